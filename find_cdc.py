@@ -1,33 +1,37 @@
-import time
-import hid
-import struct
-import sys
+import re
+import logging
 import serial
 import serial.tools.list_ports
-from enum import IntEnum
 
 # --- Device Identification ---
 # Use the same constants from your original script
 VID = 0x1067         # (4199) Vendor ID for your device
 PID = 0x626D         # (25197) Product ID for your device
-USAGE_PAGE = 0xFF60  # (65376) Raw HID Usage Page
-USAGE = 0x61         # (97) Raw HID Usage
 CDC_PRODUCT_STRING = "Module CDC Interface" # Or part of the description
 
-# --- Firmware Command ---
-class CommandID(IntEnum):
-    MODULE_CMD_DUMP_FILES_CDC = 0x61 # The command to trigger the dump
+logger = logging.getLogger(__name__)
 
-# --- HID Packet Configuration ---
-PACKET_SIZE = 32  # Adjust to match RAW_EPSIZE on your device firmware
-MAGIC_BYTE = 0x09 # Magic byte expected by firmware
+# Nodes that can never be the module (Bluetooth/RFCOMM, legacy on-board UARTs)
+NON_USB_PORT_RE = re.compile(r'bluetooth|blth|rfcomm|/dev/ttyS\d+$', re.IGNORECASE)
 
 # --- Helper to find CDC Port (Simplified from original) ---
 def find_cdc_port(vid=VID, pid=PID, product=CDC_PRODUCT_STRING):
     print(f"Searching for CDC port with VID={vid:04X}, PID={pid:04X}, Product='{product}'...")
-    ports = serial.tools.list_ports.comports()
-    for p in ports:
-        print(f"  Checking port: {p.device}, VID={p.vid}, PID={p.pid}, Product={p.product}, Desc={p.description}")
+    return _match_cdc_port(serial.tools.list_ports.comports(), vid, pid, product)
+
+def _is_candidate(p, vid, pid):
+    if p.vid == vid and p.pid == pid:
+        return True
+    if p.vid is not None:
+        return False # A different USB device
+    # No VID reported: only worth an HWID check if it isn't an obvious non-USB node
+    return not NON_USB_PORT_RE.search(p.device or "")
+
+def _match_cdc_port(ports, vid, pid, product):
+    candidates = (p for p in ports if _is_candidate(p, vid, pid))
+    for p in candidates:
+        logger.debug("Checking port: %s, VID=%s, PID=%s, Product=%s, Desc=%s",
+                     p.device, p.vid, p.pid, p.product, p.description)
         # Exact VID/PID Match
         if p.vid == vid and p.pid == pid:
             # Prefer match by product string if available
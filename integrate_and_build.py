@@ -44,55 +44,57 @@ def import_module_from_file(module_name, file_path):
     loader.exec_module(module)
     return module
 
-def run_main_with_args(args):
-    """Run the main.py module with command line arguments."""
-    # Save original sys.argv
-    original_argv = sys.argv.copy()
-    
+def load_main_module():
+    """Import main.py from next to the executable (or this script)."""
+    if getattr(sys, 'frozen', False):
+        # Running as executable
+        main_path = os.path.join(os.path.dirname(sys.executable), "main.py")
+    else:
+        # Running as script
+        main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    return import_module_from_file("main", main_path)
+
+def write_and_choose_image(main_module, image_path):
+    """Write an image to the device and select it, sharing one HID session."""
+    raw_name = os.path.splitext(os.path.basename(image_path))[0] + ".raw"
+
+    with main_module.HIDDevice(main_module.VID, main_module.PID,
+                               main_module.USAGE_PAGE, main_module.USAGE) as hid_device:
+        fs = main_module.FileSystem(hid_device)
+
+        # Same steps as `main.py --write-image-file <image_path>`
+        print("Running first command: Writing image file...")
+        image_data, processed_image = main_module.load_image_rgb565(image_path)
+        processed_image.show()
+        if not fs.open(raw_name):
+            print("Failed to open file for writing image")
+            return 1
+        main_module.wait_after_open(fs)
+        success = main_module.write_image_to_file(fs, image_data)
+        fs.close()
+        if not success:
+            print("Error executing first command")
+            return 1
+
+        # Same as `main.py --choose-image <raw_name>`
+        print("Running second command: Choosing image...")
+        if not fs.choose_image(raw_name):
+            print("Error executing second command")
+            return 1
+
+    return 0
+
+def main():
+    print("Process started...")
+
     try:
-        # Replace sys.argv with our arguments
-        sys.argv = ["main.py"] + args
-        
-        # Find main.py in the same directory as the executable
-        if getattr(sys, 'frozen', False):
-            # Running as executable
-            main_path = os.path.join(os.path.dirname(sys.executable), "main.py")
-        else:
-            # Running as script
-            main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
-        
-        # Import and run main.py
-        main_module = import_module_from_file("main", main_path)
-        
-        # If main has a main() function, call it, otherwise assume it runs on import
-        if hasattr(main_module, "main"):
-            return main_module.main()
-        return 0
-        
+        main_module = load_main_module()
+        if write_and_choose_image(main_module, "cat.png") != 0:
+            return 1
     except Exception as e:
         print(f"Error executing command: {e}")
         return 1
-    finally:
-        # Restore original sys.argv
-        sys.argv = original_argv
 
-def main():
-    print("Process started...")
-    
-    # First command
-    print("Running first command: Writing image file...")
-    result1 = run_main_with_args(["--write-image-file", "cat.png"])
-    if result1 != 0:
-        print("Error executing first command")
-        return 1
-    
-    # Second command
-    print("Running second command: Choosing image...")
-    result2 = run_main_with_args(["--choose-image", "cat.raw"])
-    if result2 != 0:
-        print("Error executing second command")
-        return 1
-    
     print("All commands executed successfully!")
     return 0
 
@@ -113,18 +115,31 @@ if __name__ == "__main__":
 
 # Build with Nuitka
 def build_with_nuitka(script_path):
+    # Fail fast rather than shipping a build with missing data files
+    data_files = ["main.py", "cat.png"]
+    missing = [file for file in data_files if not os.path.exists(file)]
+    if missing:
+        print(f"Error: Could not find required file(s): {', '.join(missing)}")
+        return False
+    # The combined script only needs cat.png; cat.raw is bundled when present
+    for file in ["cat.raw"]:
+        if os.path.exists(file):
+            data_files.append(file)
+        else:
+            print(f"Warning: Could not find {file}; building without it.")
+
     try:
         # Install Nuitka if not already installed
         install_package("nuitka")
         
-        # Copy necessary files to temp directory
-        for file in ["main.py", "cat.png", "cat.raw"]:
-            if os.path.exists(file):
-                shutil.copy(file, os.path.join(temp_dir, file))
-            else:
-                print(f"Warning: Could not find {file}, you may need to provide it manually.")
-                with open(os.path.join(temp_dir, file), "w") as f:
-                    f.write(f"# Placeholder for {file}")
+        # Link necessary files into the temp directory (no data is copied)
+        for file in data_files:
+            dst = os.path.join(temp_dir, file)
+            try:
+                os.link(file, dst)
+            except OSError:
+                # Different filesystem (EXDEV) or no hardlink support: copy instead
+                shutil.copy(file, dst)
         
         # Build command
         build_cmd = [
@@ -132,9 +147,7 @@ def build_with_nuitka(script_path):
             "--standalone",
             "--follow-imports",
             "--include-plugin-directory=.",
-            f"--include-data-files={os.path.join(temp_dir, 'main.py')}=main.py",
-            f"--include-data-files={os.path.join(temp_dir, 'cat.png')}=cat.png",
-            f"--include-data-files={os.path.join(temp_dir, 'cat.raw')}=cat.raw",
+            *(f"--include-data-files={os.path.join(temp_dir, file)}={file}" for file in data_files),
             script_path
         ]
         
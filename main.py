@@ -4,18 +4,43 @@ import struct
 import argparse
 import sys
 import os
+import hashlib
+import logging
+import functools
+import array
+from concurrent.futures import ThreadPoolExecutor
 from enum import IntEnum
-from typing import List, Tuple, Optional
+from typing import Dict, Iterable, Iterator, List, Tuple, Optional
 import serial
 import serial.tools.list_ports
-import struct
-import time
 from find_cdc import find_cdc_port
+from receive_cdc import BufferedSerialReader, write_all
 import shutil
 # random
 
-def convert_raw_to_png(raw_filepath: str, png_filepath: str, width: int = 128, height: int = 128) -> bool:
-    print(f"Attempting to convert '{os.path.basename(raw_filepath)}' to PNG...")
+# Compiled once; RAW frames are Big-Endian 16-bit RGB565 words
+_U16BE = struct.Struct('>H')
+# File sizes (CDC dump headers, FLASH_REMAINING replies) are Little-Endian uint32
+_U32LE = struct.Struct('<I')
+
+@functools.lru_cache(maxsize=1)
+def _rgb565_lut():
+    """65536x3 uint8 table of the RGB888 colour for every RGB565 word (requires NumPy)."""
+    words = np.arange(65536, dtype=np.uint16)
+    r5 = (words >> 11) & 0x1F
+    g6 = (words >> 5)  & 0x3F
+    b5 = words         & 0x1F
+
+    lut = np.empty((65536, 3), dtype=np.uint8)
+    lut[:, 0] = (r5 << 3) | (r5 >> 2)
+    lut[:, 1] = (g6 << 2) | (g6 >> 4)
+    lut[:, 2] = (b5 << 3) | (b5 >> 2)
+    return lut
+
+def convert_raw_to_png(raw_filepath: str, png_filepath: str, width: int = 128, height: int = 128,
+                       report=print) -> bool:
+    # Status lines go through report(), so a caller on another thread can collect them
+    report(f"Attempting to convert '{os.path.basename(raw_filepath)}' to PNG...")
     expected_bytes = width * height * 2 # 2 bytes per pixel for RGB565
     try:
         # Read the raw file data
@@ -24,39 +49,43 @@ def convert_raw_to_png(raw_filepath: str, png_filepath: str, width: int = 128, h
 
         # Validate size
         if len(raw_data) != expected_bytes:
-            print(f"  Error: File size mismatch for '{os.path.basename(raw_filepath)}'. Expected {expected_bytes}, got {len(raw_data)}.")
+            report(f"  Error: File size mismatch for '{os.path.basename(raw_filepath)}'. Expected {expected_bytes}, got {len(raw_data)}.")
             return False
 
-        pixels_rgb888 = []
-        # Iterate 2 bytes at a time, unpack as Big-Endian unsigned short (>H)
-        for i in range(0, len(raw_data), 2):
-            # Unpack Big-Endian short
-            rgb565 = struct.unpack('>H', raw_data[i:i+2])[0]
-
-            # Convert RGB565 to RGB888 components
-            r5 = (rgb565 >> 11) & 0x1F
-            g6 = (rgb565 >> 5)  & 0x3F
-            b5 = rgb565         & 0x1F
-
-            # Scale components to 8-bit
-            r8 = (r5 << 3) | (r5 >> 2)
-            g8 = (g6 << 2) | (g6 >> 4)
-            b8 = (b5 << 3) | (b5 >> 2)
-
-            pixels_rgb888.append((r8, g8, b8))
+        if np is not None:
+            # Each 16-bit word maps to a fixed colour, so decoding is a single table gather
+            rgb = np.take(_rgb565_lut(), np.frombuffer(raw_data, dtype='>u2'), axis=0)
+            rgb = rgb.reshape(height, width, 3)
+            img = Image.fromarray(rgb, 'RGB')
+        else:
+            # Write channels straight into one RGB888 buffer (no per-pixel tuples)
+            pixels_rgb888 = bytearray(width * height * 3)
+            j = 0
+            # Unpack consecutive Big-Endian unsigned shorts (>H) without slicing
+            for (rgb565,) in _U16BE.iter_unpack(raw_data):
+                # Convert RGB565 to RGB888 components
+                r5 = (rgb565 >> 11) & 0x1F
+                g6 = (rgb565 >> 5)  & 0x3F
+                b5 = rgb565         & 0x1F
+
+                # Scale components to 8-bit
+                pixels_rgb888[j]     = (r5 << 3) | (r5 >> 2)
+                pixels_rgb888[j + 1] = (g6 << 2) | (g6 >> 4)
+                pixels_rgb888[j + 2] = (b5 << 3) | (b5 >> 2)
+                j += 3
+
+            # Create PNG image using Pillow
+            img = Image.frombytes('RGB', (width, height), bytes(pixels_rgb888))
 
-        # Create and save PNG image using Pillow
-        img = Image.new('RGB', (width, height))
-        img.putdata(pixels_rgb888)
         img.save(png_filepath, "PNG")
-        print(f"  Successfully converted and saved to '{os.path.basename(png_filepath)}'")
+        report(f"  Successfully converted and saved to '{os.path.basename(png_filepath)}'")
         return True
 
     except FileNotFoundError:
-        print(f"  Error: Raw file not found: '{raw_filepath}'")
+        report(f"  Error: Raw file not found: '{raw_filepath}'")
         return False
     except Exception as e:
-        print(f"  Error during RAW to PNG conversion: {e}")
+        report(f"  Error during RAW to PNG conversion: {e}")
         # Optionally re-raise if you want the main script to halt on conversion error
         # raise e
         return False
@@ -67,6 +96,12 @@ except ImportError:
     print("Please install the Pillow library to use image processing functionality (pip install Pillow).")
     sys.exit(1)
 
+try:
+    import numpy as np
+except ImportError:
+    # NumPy is optional: without it the pure-Python pixel loops below are used
+    np = None
+
 class CommandID(IntEnum):
     MODULE_CMD_LS = 0x50
     MODULE_CMD_CD = 0x51
@@ -102,10 +137,34 @@ class ReturnCode(IntEnum):
     INVALID_COMMAND = 0xEF
     MORE_ENTRIES = 0xEA
 
+VID = 0x1067  # (4199) Vendor ID for your device
+PID = 0x626D  # (25197) Product ID for your device
+USAGE_PAGE = 0xFF60  # (65376)
+USAGE = 0x61  # (97)
+
 PACKET_SIZE = 32  # Adjust this to match RAW_EPSIZE on your device
+MAGIC_BYTE = 0x09 # Magic byte expected by firmware
 HEADER_SIZE = 6   # Magic number (1 byte) + Command ID (1 byte) + Packet ID (4 bytes)
 DATA_SIZE = PACKET_SIZE - HEADER_SIZE
 
+# Packet header layout, compiled once rather than parsed on every send
+PACKET_HEADER = struct.Struct('<BBI')
+# Zero padding for short payloads; slicing a memoryview doesn't allocate
+_ZERO_PAYLOAD = memoryview(bytes(DATA_SIZE))
+
+
+def iter_chunks(data: bytes, size: int = DATA_SIZE) -> Iterator[memoryview]:
+    """Yields zero-copy views of consecutive `size`-byte slices of `data`."""
+    mv = memoryview(data)
+    for i in range(0, len(mv), size):
+        yield mv[i:i + size]
+
+logger = logging.getLogger(__name__)
+
+# Device path per (vid, pid, usage_page, usage), so reopening the device in the
+# same process skips hid.enumerate (slow on Windows)
+_HID_PATH_CACHE: Dict[Tuple[int, int, int, int], bytes] = {}
+
 
 class HIDDevice:
     def __init__(self, vid: int, pid: int, usage_page: int, usage: int):
@@ -115,14 +174,25 @@ class HIDDevice:
         self.usage = usage
         self.device = None
         self.packet_id = 0
+        # Seconds to wait before each packet; 0 sends back to back (see FileSystem.slow_mode)
+        self.interframe_delay = 0.0
+        # Outgoing packets are assembled in place to avoid per-packet allocations
+        self._buf = bytearray(PACKET_SIZE)
+        self._mv = memoryview(self._buf)
+
+    def _cache_key(self) -> Tuple[int, int, int, int]:
+        return (self.vid, self.pid, self.usage_page, self.usage)
+
+    def _find_path(self) -> bytes:
+        path = _HID_PATH_CACHE.get(self._cache_key())
+        if path:
+            return path
 
-    def __enter__(self):
         # Enumerate devices by VID/PID
         all_devices = hid.enumerate(self.vid, self.pid)
 
-        # Print them for debugging
         for dev in all_devices:
-            print(dev)
+            logger.debug("Enumerated HID device: %s", dev)
 
         # Filter by usage_page and usage
         matching_devices = [
@@ -143,37 +213,62 @@ class HIDDevice:
             print("Selected device does not have a valid path.")
             sys.exit(1)
 
+        _HID_PATH_CACHE[self._cache_key()] = path
+        return path
+
+    def __enter__(self):
+        cached = self._cache_key() in _HID_PATH_CACHE
+        path = self._find_path()
         print("PATH:", path)
-        self.device = hid.Device(path=path)
+        try:
+            self.device = hid.Device(path=path)
+        except hid.HIDException:
+            if not cached:
+                raise
+            # The cached path went stale (e.g. device replugged); enumerate again
+            _HID_PATH_CACHE.pop(self._cache_key(), None)
+            path = self._find_path()
+            print("PATH:", path)
+            self.device = hid.Device(path=path)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None and issubclass(exc_type, (hid.HIDException, OSError)):
+            # The device may have been unplugged mid-session; enumerate afresh next time
+            _HID_PATH_CACHE.pop(self._cache_key(), None)
         if self.device:
             self.device.close()
 
     def send_packet(self, command_id: CommandID, data: bytes = b'') -> None:
-        packet_id_bytes = struct.pack('<I', self.packet_id)
+        n = len(data)
+        if n > DATA_SIZE:
+            # Internal guard; user-supplied names are checked by FileSystem first
+            raise ValueError(f"Packet payload is {n} bytes, at most {DATA_SIZE} fit in one packet")
         # Include the magic number 0x09 at the front of the packet
-        header = struct.pack('<BBI', 0x09, command_id, self.packet_id)
-        packet = header + data
-        packet = packet.ljust(PACKET_SIZE, b'\x00')
-        print(f"Sending packet of length {len(packet)}: {packet.hex()}")
-        self.device.write(packet)
-        time.sleep(0.001)
+        PACKET_HEADER.pack_into(self._buf, 0, MAGIC_BYTE, command_id, self.packet_id)
+        self._mv[HEADER_SIZE:HEADER_SIZE + n] = data
+        self._mv[HEADER_SIZE + n:] = _ZERO_PAYLOAD[n:]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Sending packet of length %d: %s", PACKET_SIZE, self._buf.hex())
+        if self.interframe_delay:
+            time.sleep(self.interframe_delay)
+        # hid.Device.write only accepts bytes
+        self.device.write(bytes(self._buf))
         self.packet_id += 1
 
-    def receive_packet(self) -> Tuple[int, bytes]:
+    def receive_packet(self) -> Tuple[Optional[int], Optional[memoryview]]:
         response = self.device.read(PACKET_SIZE, 1500)  # Timeout in ms
         if not response:
             print("No response received.")
             return None, None
-        print(f"Received response of length {len(response)}: {bytes(response).hex()}")
-        time.sleep(0.001)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received response of length %d: %s", len(response), bytes(response).hex())
         status = response[0]
-        data = bytes(response[1:])
+        # Zero-copy view of the payload; decode or unpack it in place
+        data = memoryview(response)[1:]
         return status, data
 
-    def execute_command(self, command_id: CommandID, data: bytes = b'') -> Tuple[ReturnCode, Optional[bytes]]:
+    def execute_command(self, command_id: CommandID, data: bytes = b'') -> Tuple[ReturnCode, Optional[memoryview]]:
         self.send_packet(command_id, data)
         status, response = self.receive_packet()
         if status is None:
@@ -181,10 +276,91 @@ class HIDDevice:
         # Return the actual status code we received
         return ReturnCode(status), response
 
+    def execute_command_batch(self, command_id: CommandID, chunks: Iterable[bytes],
+                              window: int = 16) -> Tuple[ReturnCode, int]:
+        """
+        Sends one command per chunk, keeping up to `window` packets in flight
+        instead of waiting for each response before sending the next packet.
+
+        Returns:
+            The first non-success status (or SUCCESS) and the number of chunks
+            acknowledged before it.
+        """
+        acked = 0
+        in_flight = 0
+        for chunk in chunks:
+            if in_flight == window:
+                # Window is full: wait for the oldest response before sending more
+                ret_code = self._receive_status()
+                in_flight -= 1
+                if ret_code != ReturnCode.SUCCESS:
+                    self._discard_responses(in_flight)
+                    return ret_code, acked
+                acked += 1
+            self.send_packet(command_id, chunk)
+            in_flight += 1
+
+        while in_flight:
+            ret_code = self._receive_status()
+            in_flight -= 1
+            if ret_code != ReturnCode.SUCCESS:
+                self._discard_responses(in_flight)
+                return ret_code, acked
+            acked += 1
+        return ReturnCode.SUCCESS, acked
+
+    def _receive_status(self) -> ReturnCode:
+        status, _ = self.receive_packet()
+        if status is None:
+            return ReturnCode.INVALID_COMMAND
+        return ReturnCode(status)
+
+    def discard_pending(self, timeout_ms: int = 100) -> None:
+        """Drops any responses that arrive within timeout_ms of each other, e.g. late replies."""
+        while self.device.read(PACKET_SIZE, timeout_ms):
+            pass
+
+    def _discard_responses(self, count: int) -> None:
+        # Read responses still in flight so they aren't taken as replies to later commands
+        for _ in range(count):
+            status, _ = self.receive_packet()
+            if status is None:
+                break
+
+def encode_name(name: str, reserved: int = 0) -> Optional[bytes]:
+    """
+    Encodes a device file or directory name for a single packet, leaving
+    `reserved` bytes for anything sent ahead of it. Prints an error and
+    returns None if it does not fit.
+    """
+    data = name.encode()
+    limit = DATA_SIZE - reserved
+    if len(data) > limit:
+        print(f"Error: '{name}' is {len(data)} bytes long; the device accepts at most {limit}.")
+        return None
+    return data
+
+def decode_response(response: memoryview) -> str:
+    # str() decodes the buffer directly, without copying it to bytes first
+    return str(response, 'utf-8', 'ignore').strip('\x00')
+
 class FileSystem:
+    # Inter-packet delay slow_mode restores, for firmware that can't keep up
+    SLOW_MODE_DELAY = 0.001
+    # Fixed pause the device used to be given after `open`
+    OPEN_SETTLE_DELAY = 1.0
+
     def __init__(self, hid_device: HIDDevice):
         self.hid = hid_device
 
+    @property
+    def slow_mode(self) -> bool:
+        return self.hid.interframe_delay > 0
+
+    @slow_mode.setter
+    def slow_mode(self, enabled: bool) -> None:
+        self.hid.interframe_delay = self.SLOW_MODE_DELAY if enabled else 0.0
+
     def ls(self) -> List[str]:
         all_entries = []
         
@@ -196,7 +372,7 @@ class FileSystem:
         
         # Parse entries from the first page
         if response:
-            entries = response.decode('utf-8', errors='ignore').strip('\x00').split('\x00')
+            entries = decode_response(response).split('\x00')
             entries = [e for e in entries if e]  # Filter out empty entries
             all_entries.extend(entries)
         
@@ -207,52 +383,100 @@ class FileSystem:
                 break
             
             if response:
-                entries = response.decode('utf-8', errors='ignore').strip('\x00').split('\x00')
+                entries = decode_response(response).split('\x00')
                 entries = [e for e in entries if e]
                 all_entries.extend(entries)
         
         return all_entries
 
     def cd(self, directory: str) -> bool:
-        ret_code, _ = self.hid.execute_command(CommandID.MODULE_CMD_CD, directory.encode())
+        name = encode_name(directory)
+        if name is None:
+            return False
+        ret_code, _ = self.hid.execute_command(CommandID.MODULE_CMD_CD, name)
         return ret_code == ReturnCode.SUCCESS
 
     def pwd(self) -> str:
         ret_code, response = self.hid.execute_command(CommandID.MODULE_CMD_PWD)
-        return response.decode('utf-8', errors='ignore').strip('\x00') if ret_code == ReturnCode.SUCCESS else ""
+        return decode_response(response) if ret_code == ReturnCode.SUCCESS else ""
 
     def rm(self, path: str) -> bool:
-        ret_code, _ = self.hid.execute_command(CommandID.MODULE_CMD_RM, path.encode())
+        name = encode_name(path)
+        if name is None:
+            return False
+        ret_code, _ = self.hid.execute_command(CommandID.MODULE_CMD_RM, name)
         return ret_code == ReturnCode.SUCCESS
 
     def mkdir(self, directory: str) -> bool:
-        ret_code, _ = self.hid.execute_command(CommandID.MODULE_CMD_MKDIR, directory.encode())
+        name = encode_name(directory)
+        if name is None:
+            return False
+        ret_code, _ = self.hid.execute_command(CommandID.MODULE_CMD_MKDIR, name)
         return ret_code == ReturnCode.SUCCESS
 
     def touch(self, file_path: str) -> bool:
-        ret_code, _ = self.hid.execute_command(CommandID.MODULE_CMD_TOUCH, file_path.encode())
+        name = encode_name(file_path)
+        if name is None:
+            return False
+        ret_code, _ = self.hid.execute_command(CommandID.MODULE_CMD_TOUCH, name)
         return ret_code == ReturnCode.SUCCESS
 
     def cat(self, file_path: str) -> str:
-        ret_code, response = self.hid.execute_command(CommandID.MODULE_CMD_CAT, file_path.encode())
-        return response.decode('utf-8', errors='ignore').strip('\x00') if ret_code == ReturnCode.SUCCESS else ""
+        name = encode_name(file_path)
+        if name is None:
+            return ""
+        ret_code, response = self.hid.execute_command(CommandID.MODULE_CMD_CAT, name)
+        return decode_response(response) if ret_code == ReturnCode.SUCCESS else ""
 
     def open(self, file_path: str) -> bool:
-        ret_code, _ = self.hid.execute_command(CommandID.MODULE_CMD_OPEN, file_path.encode())
+        name = encode_name(file_path)
+        if name is None:
+            return False
+        ret_code, _ = self.hid.execute_command(CommandID.MODULE_CMD_OPEN, name)
         return ret_code == ReturnCode.SUCCESS
 
+    def wait_open_ready(self, timeout: float = OPEN_SETTLE_DELAY, interval: float = 0.005) -> bool:
+        """
+        Polls the device after `open` until it answers again, instead of
+        sleeping a fixed second. FLASH_REMAINING is used as the probe because
+        it is read-only; a zero-length WRITE would append padding to the file.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            self.hid.send_packet(CommandID.MODULE_CMD_FLASH_REMAINING)
+            status, _ = self.hid.receive_packet()
+            # Firmware may answer the probe with either status
+            if status in (ReturnCode.SUCCESS, ReturnCode.FLASH_REMAINING):
+                return True
+            if status is None:
+                # The reply may still be on its way; drop it so the first WRITE
+                # of the batch isn't matched against it
+                self.hid.discard_pending()
+                return False
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(interval)
+
     def write(self, data: bytes) -> bool:
         # The data chunk should not exceed DATA_SIZE
         if len(data) > DATA_SIZE:
-            data_chunks = [data[i:i + DATA_SIZE] for i in range(0, len(data), DATA_SIZE)]
+            data_chunks = iter_chunks(data)
         else:
             data_chunks = [data]
 
-        for chunk in data_chunks:
-            ret_code, _ = self.hid.execute_command(CommandID.MODULE_CMD_WRITE, chunk)
-            if ret_code != ReturnCode.SUCCESS:
-                return False
-        return True
+        ret_code, _ = self.hid.execute_command_batch(CommandID.MODULE_CMD_WRITE, data_chunks)
+        return ret_code == ReturnCode.SUCCESS
+
+    def write_stream(self, data: bytes, window: int = 16) -> Tuple[ReturnCode, int]:
+        """
+        Writes `data` of any length to the open file in DATA_SIZE chunks, keeping
+        up to `window` packets in flight.
+
+        Returns:
+            The first non-success status (or SUCCESS) and the number of chunks
+            acknowledged before it.
+        """
+        return self.hid.execute_command_batch(CommandID.MODULE_CMD_WRITE, iter_chunks(data), window)
 
     def close(self) -> bool:
         ret_code, _ = self.hid.execute_command(CommandID.MODULE_CMD_CLOSE)
@@ -264,13 +488,19 @@ class FileSystem:
 
     def flash_remaining(self) -> int:
         ret_code, response = self.hid.execute_command(CommandID.MODULE_CMD_FLASH_REMAINING)
-        return struct.unpack('<I', response[:4])[0] if ret_code == ReturnCode.SUCCESS and response else 0
+        return _U32LE.unpack_from(response)[0] if ret_code == ReturnCode.SUCCESS and response else 0
 
     def choose_image(self, image_path: str) -> bool:
-        ret_code, _ = self.hid.execute_command(CommandID.MODULE_CMD_CHOOSE_IMAGE, image_path.encode())
+        name = encode_name(image_path)
+        if name is None:
+            return False
+        ret_code, _ = self.hid.execute_command(CommandID.MODULE_CMD_CHOOSE_IMAGE, name)
         return ret_code == ReturnCode.SUCCESS
 
     def write_display(self, data: bytes) -> bool:
+        if len(data) > DATA_SIZE:
+            print(f"Error: Display data is {len(data)} bytes; at most {DATA_SIZE} fit in one packet.")
+            return False
         ret_code, _ = self.hid.execute_command(CommandID.MODULE_CMD_WRITE_DISPLAY, data)
         return ret_code == ReturnCode.SUCCESS
 
@@ -280,17 +510,13 @@ class FileSystem:
         return ret_code == ReturnCode.SUCCESS
 
     def write_display_image(self, image_data: bytes) -> bool:
-        total_bytes = len(image_data)
-        bytes_written = 0
         packet_size = DATA_SIZE
+        chunks = iter_chunks(image_data, packet_size)
 
-        while bytes_written < total_bytes:
-            chunk = image_data[bytes_written:bytes_written + packet_size]
-            ret_code, _ = self.hid.execute_command(CommandID.MODULE_CMD_WRITE_DISPLAY, chunk)
-            if ret_code != ReturnCode.SUCCESS:
-                print(f"Failed to write display data at offset {bytes_written}")
-                return False
-            bytes_written += packet_size
+        ret_code, acked = self.hid.execute_command_batch(CommandID.MODULE_CMD_WRITE_DISPLAY, chunks)
+        if ret_code != ReturnCode.SUCCESS:
+            print(f"Failed to write display data at offset {acked * packet_size}")
+            return False
 
         return True
     
@@ -300,8 +526,11 @@ class FileSystem:
             print(f"Error: Invalid WPM mode '{mode}'. Use 'static' or 'speed'.")
             return False
         mode_byte = mode_map[mode]
+        name = encode_name(filename, reserved=1)
+        if name is None:
+            return False
         # Payload: 1-byte mode + utf-8 encoded string
-        payload = struct.pack('<B', mode_byte) + filename.encode()
+        payload = struct.pack('<B', mode_byte) + name
         ret_code, _ = self.hid.execute_command(CommandID.MODULE_CMD_WPM_SET_ANIM, payload)
         return ret_code == ReturnCode.SUCCESS
 
@@ -349,19 +578,23 @@ class FileSystem:
 
         print(f"[ls_all] Preparing output directory: '{output_dir}'")
         try:
-            if os.path.exists(output_dir):
-                if os.path.isdir(output_dir):
-                    print(f"[ls_all] Clearing existing directory: '{output_dir}'...")
-                    shutil.rmtree(output_dir) # Remove the directory and all its contents
-                    print(f"[ls_all] Directory cleared.")
-                else:
-                    # It exists but is a file - remove it
-                    print(f"[ls_all] Output path '{output_dir}' exists but is a file. Removing it...")
-                    os.remove(output_dir)
-                    print(f"[ls_all] File removed.")
-            # Recreate the directory after ensuring it's gone (or never existed)
-            os.makedirs(output_dir, exist_ok=True)
-            print(f"[ls_all] Ensured output directory exists.")
+            if os.path.isdir(output_dir) and not os.listdir(output_dir):
+                # Already exists and is empty: nothing to clear or recreate
+                print(f"[ls_all] Output directory is empty, reusing it.")
+            else:
+                if os.path.exists(output_dir):
+                    if os.path.isdir(output_dir):
+                        print(f"[ls_all] Clearing existing directory: '{output_dir}'...")
+                        shutil.rmtree(output_dir) # Remove the directory and all its contents
+                        print(f"[ls_all] Directory cleared.")
+                    else:
+                        # It exists but is a file - remove it
+                        print(f"[ls_all] Output path '{output_dir}' exists but is a file. Removing it...")
+                        os.remove(output_dir)
+                        print(f"[ls_all] File removed.")
+                # Recreate the directory after ensuring it's gone (or never existed)
+                os.makedirs(output_dir, exist_ok=True)
+                print(f"[ls_all] Ensured output directory exists.")
         except OSError as e:
             print(f"\n[ls_all] ERROR: Could not clear or create output directory '{output_dir}': {e}")
             print("[ls_all] Aborting file transfer.")
@@ -370,11 +603,26 @@ class FileSystem:
         # --- 3. Receive Files via CDC (Adapted from receive_cdc.py) ---
         print(f"[ls_all] Opening {port} to receive files...")
         print(f"[ls_all] Saving files to: {output_dir}")
-        os.makedirs(output_dir, exist_ok=True) # Ensure output directory exists
 
         files_received_count = 0
         total_bytes_received = 0
         ser = None # Initialize serial object outside try
+        # RAW->PNG conversions run here so PNG encoding (which releases the GIL)
+        # overlaps with receiving the next file instead of stalling the port
+        converter = ThreadPoolExecutor(max_workers=2)
+        # (future, status lines) per conversion, in submission order. Workers only
+        # collect their lines; this thread prints them between files, so they never
+        # land in the middle of the progress line.
+        conversions = []
+
+        def report_conversions():
+            while conversions and conversions[0][0].done():
+                _, lines = conversions.pop(0)
+                for line in lines:
+                    print(line)
+        # File data is read into this buffer and written straight to the file descriptor
+        data_buf = bytearray(65536)
+        data_mv = memoryview(data_buf)
 
         # Define timeouts (can be adjusted)
         # Timeout between filename/size/termination signal
@@ -386,28 +634,25 @@ class FileSystem:
             # Use a longer timeout initially when waiting for the first filename
             with serial.Serial(port, 115200, timeout=READ_TIMEOUT_INTER_FILE) as ser:
                 print(f"[ls_all] Serial port {port} opened. Waiting for first filename...")
+                # Every read goes through this buffer, which takes whatever the port has
+                # waiting at once; filenames are then found in memory, not read(1) per byte
+                reader = BufferedSerialReader(ser)
 
                 while True:
                     # 3a. Receive Filename (null-terminated)
-                    filename_bytes = bytearray()
-                    while True:
-                        # Read one byte at a time to detect null terminator
-                        byte = ser.read(1)
-                        if not byte: # Timeout occurred waiting for filename byte
-                            print("\n[ls_all] Timeout waiting for filename byte. Assuming transfer complete or stalled.")
-                            if files_received_count == 0:
-                                print("[ls_all] WARNING: No files received before timeout.")
-                                # Don't raise error, just break loop and finish
-                            else:
-                                print("[ls_all] Treating timeout as end-of-transfer signal.")
-                            filename_bytes = b'' # Ensure filename is empty to break outer loop
-                            break # Exit filename loop
-                        if byte == b'\0':
-                            break # End of filename
-                        filename_bytes.extend(byte)
+                    filename_bytes = reader.read_until(b'\0')
+                    timed_out = filename_bytes is None
+                    if timed_out: # Timeout occurred waiting for filename byte
+                        print("\n[ls_all] Timeout waiting for filename byte. Assuming transfer complete or stalled.")
+                        if files_received_count == 0:
+                            print("[ls_all] WARNING: No files received before timeout.")
+                            # Don't raise error, just break loop and finish
+                        else:
+                            print("[ls_all] Treating timeout as end-of-transfer signal.")
+                        filename_bytes = b'' # Ensure filename is empty to break outer loop
 
                     if not filename_bytes: # Received null byte or timed out after receiving files
-                        if files_received_count > 0 and not byte: # Check if it was timeout after success
+                        if files_received_count > 0 and timed_out: # Check if it was timeout after success
                              print("[ls_all] Timeout likely indicates completion.")
                         else: # Received explicit null byte
                              print("\n[ls_all] Received termination signal (empty filename).")
@@ -418,13 +663,13 @@ class FileSystem:
 
                     # 3b. Receive Size (4 bytes, Little Endian)
                     ser.timeout = READ_TIMEOUT_INTER_FILE # Reset timeout for reading size
-                    size_bytes = ser.read(4)
+                    size_bytes = reader.read_exact(4)
                     if len(size_bytes) < 4:
                         print(f"\n[ls_all] ERROR: Timeout or short read receiving size for '{filename}'. Expected 4 bytes, got {len(size_bytes)}.")
                         print("[ls_all] Aborting transfer.")
                         break # Exit the main loop
 
-                    expected_size = struct.unpack('<I', size_bytes)[0]
+                    expected_size, = _U32LE.unpack(size_bytes)
                     print(f"[ls_all] Expecting Size: {expected_size} bytes")
 
                     # 3c. Receive Data and Save File
@@ -433,22 +678,30 @@ class FileSystem:
                     ser.timeout = READ_TIMEOUT_DATA # Switch to data timeout for content
                     file_saved_successfully = False
                     try:
-                        with open(output_path, 'wb') as f:
+                        # Unbuffered fd: each chunk goes from data_buf to the kernel without
+                        # another copy through a Python file buffer (O_BINARY for Windows)
+                        fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+                        try:
                             start_time = time.time()
+                            last_progress = 0.0
                             while received_bytes < expected_size:
                                 # Read in chunks for efficiency
-                                bytes_to_read = min(4096, expected_size - received_bytes)
-                                chunk = ser.read(bytes_to_read)
-                                if not chunk: # Timeout occurred during data transfer
+                                bytes_to_read = min(len(data_buf), expected_size - received_bytes)
+                                n = reader.readinto(data_mv[:bytes_to_read])
+                                if not n: # Timeout occurred during data transfer
                                     print(f"\n[ls_all] ERROR: Timeout receiving data for '{filename}' at {received_bytes}/{expected_size} bytes.")
                                     raise TimeoutError(f"Timeout receiving data for {filename}")
 
-                                f.write(chunk)
-                                received_bytes += len(chunk)
+                                write_all(fd, data_mv[:n])
+                                received_bytes += n
 
-                                # Simple progress indicator within a file
-                                progress_percent = int((received_bytes / expected_size) * 100) if expected_size > 0 else 100
-                                print(f"... {progress_percent}% ({received_bytes}/{expected_size} bytes)", end='\r')
+                                # Simple progress indicator within a file, throttled to 10 updates
+                                # a second so terminal output can't hold up the read loop
+                                now = time.monotonic()
+                                if now - last_progress >= 0.1 or received_bytes == expected_size:
+                                    last_progress = now
+                                    progress_percent = int((received_bytes / expected_size) * 100) if expected_size > 0 else 100
+                                    print(f"... {progress_percent}% ({received_bytes}/{expected_size} bytes)", end='\r')
 
                             # Ensure newline after progress indicator finishes
                             print()
@@ -460,14 +713,19 @@ class FileSystem:
                             files_received_count += 1
                             total_bytes_received += received_bytes
                             file_saved_successfully = True
+                        finally:
+                            os.close(fd)
 
                         # Check if the successfully saved file is a .raw file
                         if file_saved_successfully and output_path.lower().endswith(".raw"):
                             png_filename = os.path.splitext(output_path)[0] + ".png"
-                            # Call the helper function (defined earlier in the file)
-                            convert_raw_to_png(output_path, png_filename)
+                            # Call the helper function (defined earlier in the file) in the background
+                            lines = []
+                            conversions.append((converter.submit(convert_raw_to_png, output_path, png_filename,
+                                                                 report=lines.append), lines))
                         elif file_saved_successfully:
                              print(f"Skipping PNG conversion for non-.raw file: {os.path.basename(output_path)}")
+                        report_conversions()
 
                     except TimeoutError:
                         # Clean up potentially incomplete file
@@ -496,6 +754,9 @@ class FileSystem:
             traceback.print_exc()
         finally:
             # No need to close ser explicitly if using 'with' statement
+            # Let any pending PNG conversions finish before reporting
+            converter.shutdown(wait=True)
+            report_conversions()
             print(f"\n[ls_all] CDC Receiver process finished.")
             print(f"[ls_all] Total files successfully received: {files_received_count}")
             print(f"[ls_all] Total bytes received: {total_bytes_received}")
@@ -512,108 +773,307 @@ def rgb565_to_rgb(rgb565):
     b8 = (b5 << 3) | (b5 >> 2)
     return (r8, g8, b8)
 
-def color_distance(c1, c2):
-    return ((c1[0]-c2[0])**2 + (c1[1]-c2[1])**2 + (c1[2]-c2[2])**2)
+@functools.lru_cache(maxsize=8)
+def _solid_background(size: Tuple[int, int], color: Tuple[int, int, int]) -> Image.Image:
+    # alpha_composite doesn't modify its inputs, so one background per size/colour is reused
+    return Image.new('RGBA', size, color)
+
+def has_transparency(image: Image.Image) -> bool:
+    """True if the image has an alpha channel or a transparent palette entry/colour key."""
+    return image.mode in ('RGBA', 'RGBa', 'LA', 'La', 'PA') or 'transparency' in image.info
+
+def flatten_alpha(image: Image.Image, background_color: Tuple[int, int, int] = (0, 0, 0)) -> Image.Image:
+    """Composites an RGBA image onto a solid background; other modes are returned as-is."""
+    if image.mode != 'RGBA':
+        return image
+    image = Image.alpha_composite(_solid_background(image.size, tuple(background_color)), image)
+    return image.convert('RGB')
+
+def as_rgb(image: Image.Image) -> Image.Image:
+    """The image in RGB mode; convert() would copy even an image that already is."""
+    return image if image.mode == 'RGB' else image.convert('RGB')
+
+def _image_planes(image: Image.Image):
+    """Splits an image into contiguous uint8 R, G and B planes (requires NumPy)."""
+    # Image.split() de-interleaves in C, so each plane has unit stride rather than
+    # being a step-3 view into the interleaved RGB buffer
+    return tuple(np.asarray(band) for band in as_rgb(image).split())
+
+# Image.point table (R, G and B bands) that clears the bits RGB565 drops, i.e. the
+# colour each pixel will actually have on the display
+RGB565_PREVIEW_TABLE = [v & 0xF8 for v in range(256)] + [v & 0xFC for v in range(256)] + [v & 0xF8 for v in range(256)]
+
+# Per-channel contributions to an RGB565 value, for the pure-Python fallback: a
+# table lookup is cheaper in CPython than the shift and mask it replaces. Tuples
+# rather than array('H') so a lookup returns a stored int instead of boxing a new one.
+_RGB565_R_LUT = tuple((v >> 3) << 11 for v in range(256))
+_RGB565_G_LUT = tuple((v >> 2) << 5 for v in range(256))
+_RGB565_B_LUT = tuple(v >> 3 for v in range(256))
 
 def image_to_rgb565(image: Image.Image, background_color: Tuple[int, int, int] = (0, 0, 0)):
-    # Handle images with transparency by pasting onto a background
-    if image.mode == 'RGBA':
-        background = Image.new('RGBA', image.size, background_color)
-        image = Image.alpha_composite(background, image.convert('RGBA'))
-        image = image.convert('RGB')
-
-    image_data = bytearray()
-    pixels = list(image.getdata())
-    processed_pixels = []
-
-    for r, g, b in pixels:
-        r5 = r >> 3
-        g6 = g >> 2
-        b5 = b >> 3
-        rgb565 = (r5 << 11) | (g6 << 5) | b5
+    image = flatten_alpha(image, background_color)
+
+    if np is not None:
+        # Vectorized path: pack the whole frame at once instead of per pixel
+        r, g, b = _image_planes(image)
+        # Only the shifted channels need widening to 16 bits; the planes stay uint8
+        rgb565 = ((r.astype(np.uint16) >> 3) << 11) | ((g.astype(np.uint16) >> 2) << 5) | (b >> 3)
+        # Preview shows the colours as the display will, with the dropped low bits cleared
+        processed_image = as_rgb(image).point(RGB565_PREVIEW_TABLE)
         # Use big-endian packing for RGB565
-        image_data.extend(struct.pack('>H', rgb565))
-        processed_pixels.append((r, g, b))
-
-    processed_image = Image.new('RGB', image.size)
-    processed_image.putdata(processed_pixels)
-    return bytes(image_data), processed_image
+        return rgb565.astype('>u2').tobytes(), processed_image
+
+    image = as_rgb(image)
+    # Walk the raw RGB buffer rather than a list of per-pixel tuples
+    pixels = image.tobytes()
+    # Collect native uint16s and fix the byte order once, instead of a struct.pack per pixel
+    r_lut, g_lut, b_lut = _RGB565_R_LUT, _RGB565_G_LUT, _RGB565_B_LUT
+    image_data = array.array('H', [r_lut[r] | g_lut[g] | b_lut[b]
+                                   for r, g, b in zip(pixels[0::3], pixels[1::3], pixels[2::3])])
+    if sys.byteorder == 'little':
+        image_data.byteswap() # Use big-endian packing for RGB565
+
+    # Same preview as the NumPy path; Pillow applies the per-band table in C
+    processed_image = image.point(RGB565_PREVIEW_TABLE)
+    return image_data.tobytes(), processed_image
+
+# Colours image_to_rgb565_quantized snaps every pixel to, and their RGB888 values.
+# Fixed, so the lookup arrays and tables below are built once at import.
+QUANTIZE_COLORS_RGB565 = [
+    0xE007,  # Green
+    0x00F8,  # Blue
+    0x1F00,  # Red
+]
+QUANTIZE_COLORS_RGB = [rgb565_to_rgb(c) for c in QUANTIZE_COLORS_RGB565]
+
+if np is not None:
+    # Use big-endian packing for RGB565
+    _QUANTIZE_CODES = np.array(QUANTIZE_COLORS_RGB565, dtype='>u2')
+    _QUANTIZE_RGB = np.array(QUANTIZE_COLORS_RGB, dtype=np.uint8)
+
+# Pillow palette for the no-NumPy path. Pad by repeating the first entry; zero
+# padding would add black as a candidate.
+_QUANTIZE_PALETTE_IMAGE = Image.new('P', (1, 1))
+_QUANTIZE_PALETTE_IMAGE.putpalette([v for rgb in QUANTIZE_COLORS_RGB for v in rgb]
+                                   + list(QUANTIZE_COLORS_RGB[0]) * (256 - len(QUANTIZE_COLORS_RGB)))
+# bytes.translate tables from palette index to the high and low byte of its RGB565 code
+_QUANTIZE_CODE_HI = bytes(QUANTIZE_COLORS_RGB565[i] >> 8 if i < len(QUANTIZE_COLORS_RGB565)
+                          else QUANTIZE_COLORS_RGB565[0] >> 8 for i in range(256))
+_QUANTIZE_CODE_LO = bytes(QUANTIZE_COLORS_RGB565[i] & 0xFF if i < len(QUANTIZE_COLORS_RGB565)
+                          else QUANTIZE_COLORS_RGB565[0] & 0xFF for i in range(256))
+
+def _nearest_palette_index(r, g, b, palette: List[Tuple[int, int, int]]):
+    """
+    Returns, for each pixel of the R, G and B planes, the index of the nearest
+    palette colour (first one on ties), like argmin over squared distances.
+    """
+    # |x - p|^2 = |x|^2 - 2x.p + |p|^2, and |x|^2 is the same for every palette
+    # colour, so comparing |p|^2 - 2x.p is enough. Keep a running minimum, updated
+    # in place, rather than a pixels x palette distance matrix.
+    r, g, b = (plane.astype(np.int32) for plane in (r, g, b))
+    best = np.empty_like(r)
+    dist = np.empty_like(r)
+    term = np.empty_like(r)
+    idx = np.zeros(r.shape, dtype=np.uint8)
+    for i, (pr, pg, pb) in enumerate(palette):
+        np.multiply(r, -2 * pr, out=dist)
+        dist += np.multiply(g, -2 * pg, out=term)
+        dist += np.multiply(b, -2 * pb, out=term)
+        dist += pr * pr + pg * pg + pb * pb
+        if i == 0:
+            best[...] = dist
+        else:
+            idx[dist < best] = i
+            np.minimum(best, dist, out=best)
+    return idx
 
 def image_to_rgb565_quantized(image: Image.Image, background_color: Tuple[int, int, int] = (0, 0, 0)):
-    # Handle images with transparency by pasting onto a background
-    if image.mode == 'RGBA':
-        background = Image.new('RGBA', image.size, background_color)
-        image = Image.alpha_composite(background, image.convert('RGBA'))
-        image = image.convert('RGB')
+    image = flatten_alpha(image, background_color)
+    # Match colours as RGB565 will represent them (low bits cleared), so the
+    # 5-6-5 truncation is accounted for when picking the nearest palette entry
+    image = as_rgb(image).point(RGB565_PREVIEW_TABLE)
+
+    if np is not None:
+        r, g, b = (plane.ravel() for plane in _image_planes(image))
+        idx = _nearest_palette_index(r, g, b, QUANTIZE_COLORS_RGB)
+        image_data = _QUANTIZE_CODES[idx].tobytes()
+        processed = np.take(_QUANTIZE_RGB, idx, axis=0)
+        processed_image = Image.fromarray(processed.reshape(image.size[1], image.size[0], 3))
+        return image_data, processed_image
+
+    # Without NumPy, Pillow's C quantizer picks the palette entries instead of a
+    # per-pixel Python loop. Its lookup works at 6 bits per channel, which the
+    # RGB565-rounded pixels already fit, so it agrees with the search above.
+    quantized = image.quantize(palette=_QUANTIZE_PALETTE_IMAGE, dither=Image.Dither.NONE)
+
+    # Map palette indices to the high and low bytes of their RGB565 code
+    indices = quantized.tobytes()
+    image_data = bytearray(2 * len(indices))
+    # Use big-endian packing for RGB565
+    image_data[0::2] = indices.translate(_QUANTIZE_CODE_HI)
+    image_data[1::2] = indices.translate(_QUANTIZE_CODE_LO)
+
+    processed_image = quantized.convert('RGB')
+    return bytes(image_data), processed_image
 
-    image_data = bytearray()
-    pixels = list(image.getdata())
-    colors_rgb565 = [
-        0xE007,  # Green
-        0x00F8,  # Blue
-        0x1F00,  # Red
-    ]
-    colors_rgb = [rgb565_to_rgb(c) for c in colors_rgb565]
-    processed_pixels = []
-
-    for r, g, b in pixels:
-        min_dist = None
-        closest_color = None
-        for i, color in enumerate(colors_rgb):
-            dist = color_distance((r, g, b), color)
-            if (min_dist is None) or (dist < min_dist):
-                min_dist = dist
-                closest_color = colors_rgb565[i]
-        # Use big-endian packing for RGB565
-        image_data.extend(struct.pack('>H', closest_color))
-        processed_pixels.append(rgb565_to_rgb(closest_color))
+# Large downscales first shrink by an integer factor with a cheap box reduce (and,
+# for JPEGs, DCT scaling in the decoder), leaving the resample filter only the last
+# <=3x step, like Image.thumbnail. Pillow skips the reduce for images with alpha.
+RESIZE_REDUCING_GAP = 3.0
+
+def resize_image(image: Image.Image, size: Tuple[int, int], resample: int = Image.LANCZOS) -> Image.Image:
+    """Resizes a freshly opened image to `size`, shortcutting large downscales."""
+    image.draft(None, (int(size[0] * RESIZE_REDUCING_GAP), int(size[1] * RESIZE_REDUCING_GAP)))
+    return image.resize(size, resample, reducing_gap=RESIZE_REDUCING_GAP)
+
+# Converted images are memoized here so re-sending the same file skips the
+# resize and RGB565 conversion
+IMAGE_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "toffee")
+# Part of the cache key; bump when the conversion output changes
+IMAGE_CACHE_VERSION = 2
+# Entries kept before the least recently used are pruned (each is ~32 KB plus its preview)
+IMAGE_CACHE_MAX_ENTRIES = 100
+
+def _image_cache_paths(image_path: str, size: Tuple[int, int], quantize: bool,
+                       background_color: Tuple[int, int, int], resample: int) -> Tuple[str, str]:
+    key = repr((IMAGE_CACHE_VERSION, os.path.abspath(image_path), os.path.getmtime(image_path), size,
+                quantize, tuple(background_color), int(resample), RESIZE_REDUCING_GAP))
+    base = os.path.join(IMAGE_CACHE_DIR, hashlib.sha1(key.encode()).hexdigest())
+    return base + ".raw", base + ".png"
+
+def _prune_image_cache(max_entries: int = IMAGE_CACHE_MAX_ENTRIES) -> None:
+    """Removes the least recently used cache entries beyond max_entries, by mtime of the .raw file."""
+    try:
+        with os.scandir(IMAGE_CACHE_DIR) as it:
+            entries = [(e.stat().st_mtime, e.path) for e in it if e.name.endswith(".raw")]
+    except OSError as e:
+        logger.debug("Could not list image cache: %s", e)
+        return
+    entries.sort(reverse=True)
+    for _, raw_path in entries[max_entries:]:
+        for path in (raw_path, os.path.splitext(raw_path)[0] + ".png"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass # Already gone, or removed by a concurrent run
+
+def load_image_rgb565(image_path: str, size: Tuple[int, int] = (128, 128), quantize: bool = False,
+                      background_color: Tuple[int, int, int] = (0, 0, 0),
+                      resample: int = Image.LANCZOS) -> Tuple[bytes, Image.Image]:
+    """
+    Opens an image file, resizes it and converts it to RGB565, reusing a
+    previous conversion of the same file (by path and mtime) when cached.
+
+    Returns:
+        The RGB565 bytes and the preview image, as image_to_rgb565 does.
+    """
+    raw_path, preview_path = _image_cache_paths(image_path, size, quantize, background_color, resample)
+    try:
+        with open(raw_path, 'rb') as f:
+            image_data = f.read()
+        if len(image_data) == size[0] * size[1] * 2:
+            processed_image = Image.open(preview_path)
+            processed_image.load()
+            os.utime(raw_path) # Mark as recently used so pruning keeps it
+            return image_data, processed_image
+    except OSError:
+        pass # Not cached yet (or unreadable): convert below
+
+    image = Image.open(image_path)
+    if image.size != size:
+        image = resize_image(image, size, resample)
+    # Only images that can be transparent need the alpha channel for compositing;
+    # opaque ones (JPEG, most PNGs) go straight to RGB and skip a 4-byte-per-pixel copy
+    image = image.convert('RGBA' if has_transparency(image) else 'RGB')
+    if quantize:
+        image_data, processed_image = image_to_rgb565_quantized(image, background_color=background_color)
+    else:
+        image_data, processed_image = image_to_rgb565(image, background_color=background_color)
 
-    processed_image = Image.new('RGB', image.size)
-    processed_image.putdata(processed_pixels)
-    return bytes(image_data), processed_image
+    try:
+        os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+        # Write to temporary names first so a crash can't leave a truncated entry
+        processed_image.save(preview_path + ".tmp", "PNG")
+        with open(raw_path + ".tmp", 'wb') as f:
+            f.write(image_data)
+        os.replace(preview_path + ".tmp", preview_path)
+        os.replace(raw_path + ".tmp", raw_path)
+    except OSError as e:
+        logger.debug("Could not cache converted image: %s", e)
+    else:
+        _prune_image_cache()
+
+    return image_data, processed_image
 
 def create_colored_bars_image(width: int, height: int) -> bytes:
-    image_data = bytearray()
     bar_width = width // 8
     colors = [
         0xE007,  # Green
         0x00F8,  # Blue
         0x1F00,  # Red
     ]
-    for y in range(height):
-        for x in range(width):
-            color_index = (x // bar_width) % len(colors)
-            # Use big-endian packing for RGB565
-            image_data.extend(struct.pack('>H', colors[color_index]))
-    return bytes(image_data)
-
-def create_animated_bars(width: int, height: int, num_frames: int) -> bytes:
+    if np is not None:
+        # Every row is identical: build one and repeat it down the frame
+        color_index = (np.arange(width) // bar_width) % len(colors)
+        row = np.array(colors, dtype='>u2')[color_index]
+        return np.broadcast_to(row, (height, width)).tobytes()
+
+    # Without NumPy, still pack a single row and repeat it
     image_data = bytearray()
+    for x in range(width):
+        color_index = (x // bar_width) % len(colors)
+        # Use big-endian packing for RGB565
+        image_data.extend(_U16BE.pack(colors[color_index]))
+    return bytes(image_data) * height
+
+def create_animated_bars(width: int, height: int, num_frames: int, out: Optional[bytearray] = None):
+    """
+    Returns `num_frames` RGB565 frames of scrolling colour bars, back to back.
+    If `out` is given (width * height * 2 * num_frames bytes), the frames are
+    written into it in place and it is returned instead of a new bytes object.
+    """
     colors = [
         0xE007,  # Green
         0x00F8,  # Blue
         0x1F00,  # Red
     ]
+    # Each frame is the same bar pattern shifted 2px further, so all frame rows are
+    # windows into one base row that is just wide enough for the last shift
+    max_shift = max(num_frames - 1, 0) * 2
+    if np is not None:
+        xs = np.arange(width + max_shift)
+        base_row = np.array(colors, dtype='>u2')[(xs // 16) % len(colors)]
+        rows = np.lib.stride_tricks.sliding_window_view(base_row, width)[::2][:num_frames]
+        frames = np.broadcast_to(rows[:, None, :], (num_frames, height, width))
+        if out is None:
+            return frames.tobytes()
+        np.copyto(np.frombuffer(out, dtype='>u2').reshape(frames.shape), frames)
+        return out
+
+    base_row = bytearray()
+    for x in range(width + max_shift):
+        color_index = (x // 16) % len(colors)
+        # Use big-endian packing for RGB565
+        base_row.extend(_U16BE.pack(colors[color_index]))
+    frame_size = width * height * 2
+    image_data = out if out is not None else bytearray(frame_size * num_frames)
     for frame in range(num_frames):
         offset = frame * 2
-        for y in range(height):
-            for x in range(width):
-                color_index = ((x + offset) // 16) % len(colors)
-                # Use big-endian packing for RGB565
-                image_data.extend(struct.pack('>H', colors[color_index]))
-    return bytes(image_data)
+        image_data[frame * frame_size:(frame + 1) * frame_size] = base_row[2 * offset:2 * (offset + width)] * height
+    return image_data if out is not None else bytes(image_data)
+
+def wait_after_open(fs: FileSystem) -> None:
+    """Waits for the device to finish `open`, falling back to the old fixed delay if it never answers."""
+    if not fs.wait_open_ready():
+        print(f"Warning: Device did not answer after open; waiting {fs.OPEN_SETTLE_DELAY}s before writing.")
+        time.sleep(fs.OPEN_SETTLE_DELAY)
 
 def write_image_to_file(fs: FileSystem, image_data: bytes) -> bool:
-    total_bytes = len(image_data)
-    bytes_written = 0
     packet_size = DATA_SIZE
-
-    while bytes_written < total_bytes:
-        chunk = image_data[bytes_written:bytes_written + packet_size]
-        if not fs.write(chunk):
-            print(f"Failed to write chunk at offset {bytes_written}")
-            return False
-        bytes_written += packet_size
+    ret_code, acked = fs.write_stream(image_data)
+    if ret_code != ReturnCode.SUCCESS:
+        print(f"Failed to write chunk at offset {acked * packet_size}")
+        return False
 
     return True
 
@@ -629,12 +1089,130 @@ def find_qmk_device(vid, pid, usage_page, usage):
     return None
 
 
-def main():
-    VID = 0x1067  # (4199) Vendor ID for your device
-    PID = 0x626D  # (25197) Product ID for your device
-    USAGE_PAGE = 0xFF60  # (65376)
-    USAGE = 0x61  # (97)
+def cmd_set_time(fs: FileSystem, args) -> None:
+    hour, minute, second = args.set_time
+    print("Set time:", fs.set_time(hour, minute, second))
+
+def cmd_write_test_image(fs: FileSystem, args) -> None:
+    image_data = create_colored_bars_image(128, 128)
+    if fs.open("test_image.raw"):
+        wait_after_open(fs)
+        success = write_image_to_file(fs, image_data)
+        fs.close()
+        print(f"Wrote test image: {'Success' if success else 'Failed'}")
+    else:
+        print("Failed to open file for writing test image")
+
+def cmd_write_test_anim(fs: FileSystem, args) -> None:
+    num_frames = 12
+    # Frames are generated straight into the buffer that gets written out
+    image_data = create_animated_bars(128, 128, num_frames, out=bytearray(128 * 128 * 2 * num_frames))
+    if fs.open("test_anim.araw"):
+        wait_after_open(fs)
+        success = write_image_to_file(fs, image_data)
+        fs.close()
+        print(f"Wrote test animation: {'Success' if success else 'Failed'}")
+    else:
+        print("Failed to open file for writing test animation")
+
+def resample_filter(args) -> int:
+    # BICUBIC's kernel is a plain polynomial, so it skips the sin() evaluations that
+    # dominate LANCZOS. At 128x128 the loss in sharpness is barely visible.
+    return Image.BICUBIC if args.fast_resize else Image.LANCZOS
+
+def cmd_write_image_immediate(fs: FileSystem, args) -> None:
+    image_data, processed_image = load_image_rgb565(args.write_image_immediate, quantize=args.quantize,
+                                                    background_color=args.background_color,
+                                                    resample=resample_filter(args))
+    processed_image.show()
+    success = fs.write_display_image(image_data)
+    print(f"Wrote image directly to display: {'Success' if success else 'Failed'}")
+
+def cmd_write_image_file(fs: FileSystem, args) -> None:
+    image_data, processed_image = load_image_rgb565(args.write_image_file, quantize=args.quantize,
+                                                    background_color=args.background_color,
+                                                    resample=resample_filter(args))
+    processed_image.show()
+    output_filename = os.path.splitext(os.path.basename(args.write_image_file))[0] + ".raw"
+    if fs.open(output_filename):
+        wait_after_open(fs)
+        success = write_image_to_file(fs, image_data)
+        fs.close()
+        print(f"Wrote image to {output_filename}: {'Success' if success else 'Failed'}")
+    else:
+        print("Failed to open file for writing image")
+
+def cmd_wpm_gif(fs: FileSystem, args) -> None:
+    filename = args.wpm_gif[0]
+    mode = 'speed' # Default mode
+    if len(args.wpm_gif) > 1:
+        mode = args.wpm_gif[1].lower()
+
+    print(f"Setting WPM indicator animation to: '{filename}' (Mode: {mode})")
+    success = fs.set_wpm_anim(filename, mode)
+    print(f"Set WPM animation: {'Success' if success else 'Failed'}")
+
+def cmd_wpm_range(fs: FileSystem, args) -> None:
+    if len(args.wpm_range) < 2:
+        print("Error: --wpm-range requires at least MIN and MAX values.", file=sys.stderr)
+        return
+
+    min_wpm = args.wpm_range[0]
+    max_wpm = args.wpm_range[1]
+    max_fps = 24 # Default max_fps
+    if len(args.wpm_range) > 2:
+        max_fps = args.wpm_range[2]
+
+    try:
+        if not (0 <= min_wpm < max_wpm <= 255 and 1 <= max_fps <= 60):
+            raise ValueError("Values must be: 0<=MIN<MAX<=255, 1<=FPS<=60.")
+
+        print(f"Setting WPM range to {min_wpm}-{max_wpm} WPM, with max {max_fps} FPS")
+        success = fs.set_wpm_config(min_wpm, max_wpm, max_fps)
+        print(f"Set WPM config: {'Success' if success else 'Failed'}")
+
+    except ValueError as e:
+        print(f"Error: Invalid WPM range. {e}", file=sys.stderr)
+
+def cmd_ls_all(fs: FileSystem, args) -> None:
+    output_directory = args.output_dir # Get the directory from the argument value
+    print(f"Attempting to retrieve all files to directory: '{output_directory}'")
+    saved_file_list = fs.ls_all(output_directory)
+    if saved_file_list:
+        print("\nSuccessfully saved files:")
+        for f_path in saved_file_list:
+            print(f"- {f_path}")
+    else:
+         print("\nNo files were saved successfully.")
+
+# Checked in order; the first flag that is set on the command line runs
+COMMAND_HANDLERS = {
+    'ls': lambda fs, args: print("Directory contents:", fs.ls()),
+    'cd': lambda fs, args: print("Changed directory:", fs.cd(args.cd)),
+    'pwd': lambda fs, args: print("Current directory:", fs.pwd()),
+    'rm': lambda fs, args: print("Removed:", fs.rm(args.rm)),
+    'mkdir': lambda fs, args: print("Created directory:", fs.mkdir(args.mkdir)),
+    'touch': lambda fs, args: print("Created file:", fs.touch(args.touch)),
+    'cat': lambda fs, args: print("File contents:", fs.cat(args.cat)),
+    'open': lambda fs, args: print("Opened file:", fs.open(args.open)),
+    'write': lambda fs, args: print("Wrote to file:", fs.write(args.write.encode())),
+    'close': lambda fs, args: print("Closed file:", fs.close()),
+    'format': lambda fs, args: print("Formatted filesystem:", fs.format_filesystem()),
+    'flash_remaining': lambda fs, args: print("Flash remaining:", fs.flash_remaining()),
+    'choose_image': lambda fs, args: print("Chose image:", fs.choose_image(args.choose_image)),
+    'write_display': lambda fs, args: print("Wrote to display:", fs.write_display(args.write_display.encode())),
+    'set_time': cmd_set_time,
+    'write_test_image': cmd_write_test_image,
+    'write_test_anim': cmd_write_test_anim,
+    'write_image_immediate': cmd_write_image_immediate,
+    'write_image_file': cmd_write_image_file,
+    'wpm_gif': cmd_wpm_gif,
+    'wpm_range': cmd_wpm_range,
+    'ls_all': cmd_ls_all,
+}
+
 
+def main():
     parser = argparse.ArgumentParser(description="HID File System Command Line Utility")
     parser.add_argument("--ls", action="store_true", help="List directory contents")
     parser.add_argument("--cd", help="Change directory")
@@ -658,138 +1236,26 @@ def main():
     parser.add_argument("--ls_all", action="store_true", help="Retrieve all .raw/.araw files via CDC using the default or specified output directory.")
     parser.add_argument("--output-dir",metavar='DIR', default="dumped_files", help="Directory to save files for --ls_all (default: dumped_files)")
     parser.add_argument("--quantize", action="store_true", help="Quantize image colors to specific colors")
+    parser.add_argument("--fast-resize", action="store_true", help="Resize images with a bicubic filter instead of Lanczos (faster, slightly softer)")
     parser.add_argument("--background-color", type=str, default="0,0,0", help="Background color for transparency (format: R,G,B)")
     parser.add_argument("--wpm-gif", nargs='+', metavar=('FILENAME.araw', 'MODE'), help="Set the WPM indicator. MODE is optional ('speed' or 'static', default is 'speed').")
     parser.add_argument("--wpm-range", nargs='+', type=int, metavar=('MIN', 'MAX', 'FPS'), help="Set WPM range and optionally max FPS (e.g., 20 150 24).")
+    parser.add_argument("--verbose", action="store_true", help="Log every HID packet sent and received")
+    parser.add_argument("--slow-mode", action="store_true", help="Pause 1ms before every HID packet, for firmware that drops back-to-back packets")
 
     args = parser.parse_args()
-    background_color = tuple(map(int, args.background_color.split(',')))
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+    args.background_color = tuple(map(int, args.background_color.split(',')))
 
     with HIDDevice(VID, PID, USAGE_PAGE, USAGE) as hid_device:
         fs = FileSystem(hid_device)
+        fs.slow_mode = args.slow_mode
 
-        if args.ls:
-            print("Directory contents:", fs.ls())
-        elif args.cd:
-            print("Changed directory:", fs.cd(args.cd))
-        elif args.pwd:
-            print("Current directory:", fs.pwd())
-        elif args.rm:
-            print("Removed:", fs.rm(args.rm))
-        elif args.mkdir:
-            print("Created directory:", fs.mkdir(args.mkdir))
-        elif args.touch:
-            print("Created file:", fs.touch(args.touch))
-        elif args.cat:
-            print("File contents:", fs.cat(args.cat))
-        elif args.open:
-            print("Opened file:", fs.open(args.open))
-        elif args.write:
-            print("Wrote to file:", fs.write(args.write.encode()))
-        elif args.close:
-            print("Closed file:", fs.close())
-        elif args.format:
-            print("Formatted filesystem:", fs.format_filesystem())
-        elif args.flash_remaining:
-            print("Flash remaining:", fs.flash_remaining())
-        elif args.choose_image:
-            print("Chose image:", fs.choose_image(args.choose_image))
-        elif args.write_display:
-            print("Wrote to display:", fs.write_display(args.write_display.encode()))
-        elif args.set_time:
-            hour, minute, second = args.set_time
-            print("Set time:", fs.set_time(hour, minute, second))
-        elif args.write_test_image:
-            image_data = create_colored_bars_image(128, 128)
-            if fs.open("test_image.raw"):
-                time.sleep(1)
-                success = write_image_to_file(fs, image_data)
-                fs.close()
-                print(f"Wrote test image: {'Success' if success else 'Failed'}")
-            else:
-                print("Failed to open file for writing test image")
-
-        elif args.write_test_anim:
-            image_data = create_animated_bars(128, 128, 12)  # e.g. 12 frames
-            if fs.open("test_anim.araw"):
-                time.sleep(1)
-                success = write_image_to_file(fs, image_data)
-                fs.close()
-                print(f"Wrote test animation: {'Success' if success else 'Failed'}")
-            else:
-                print("Failed to open file for writing test animation")
-        elif args.write_image_immediate:
-            image = Image.open(args.write_image_immediate)
-            image = image.resize((128, 128), Image.LANCZOS)
-            image = image.convert('RGBA')  # Ensure the image has an alpha channel
-            if args.quantize:
-                image_data, processed_image = image_to_rgb565_quantized(image, background_color=background_color)
-            else:
-                image_data, processed_image = image_to_rgb565(image, background_color=background_color)
-            processed_image.show()
-            success = fs.write_display_image(image_data)
-            print(f"Wrote image directly to display: {'Success' if success else 'Failed'}")
-        elif args.write_image_file:
-            image = Image.open(args.write_image_file)
-            image = image.resize((128, 128), Image.LANCZOS)
-            image = image.convert('RGBA')
-            if args.quantize:
-                image_data, processed_image = image_to_rgb565_quantized(image, background_color=background_color)
-            else:
-                image_data, processed_image = image_to_rgb565(image, background_color=background_color)
-            processed_image.show()
-            output_filename = os.path.splitext(os.path.basename(args.write_image_file))[0] + ".raw"
-            if fs.open(output_filename):
-                time.sleep(1)
-                success = write_image_to_file(fs, image_data)
-                fs.close()
-                print(f"Wrote image to {output_filename}: {'Success' if success else 'Failed'}")
-            else:
-                print("Failed to open file for writing image")
-
-        elif args.wpm_gif:
-            filename = args.wpm_gif[0]
-            mode = 'speed' # Default mode
-            if len(args.wpm_gif) > 1:
-                mode = args.wpm_gif[1].lower()
-            
-            print(f"Setting WPM indicator animation to: '{filename}' (Mode: {mode})")
-            success = fs.set_wpm_anim(filename, mode)
-            print(f"Set WPM animation: {'Success' if success else 'Failed'}")
-
-        elif args.wpm_range:
-            if len(args.wpm_range) < 2:
-                print("Error: --wpm-range requires at least MIN and MAX values.", file=sys.stderr)
-            else:
-                min_wpm = args.wpm_range[0]
-                max_wpm = args.wpm_range[1]
-                max_fps = 24 # Default max_fps
-                if len(args.wpm_range) > 2:
-                    max_fps = args.wpm_range[2]
-
-                try:
-                    if not (0 <= min_wpm < max_wpm <= 255 and 1 <= max_fps <= 60):
-                        raise ValueError("Values must be: 0<=MIN<MAX<=255, 1<=FPS<=60.")
-                    
-                    print(f"Setting WPM range to {min_wpm}-{max_wpm} WPM, with max {max_fps} FPS")
-                    success = fs.set_wpm_config(min_wpm, max_wpm, max_fps)
-                    print(f"Set WPM config: {'Success' if success else 'Failed'}")
-
-                except ValueError as e:
-                    print(f"Error: Invalid WPM range. {e}", file=sys.stderr)
-
-        elif args.ls_all:
-            output_directory = args.output_dir # Get the directory from the argument value
-            print(f"Attempting to retrieve all files to directory: '{output_directory}'")
-            saved_file_list = fs.ls_all(output_directory)
-            if saved_file_list:
-                print("\nSuccessfully saved files:")
-                for f_path in saved_file_list:
-                    print(f"- {f_path}")
-            else:
-                 print("\nNo files were saved successfully.")
-        else:
-            parser.print_help()
+        for name, handler in COMMAND_HANDLERS.items():
+            if getattr(args, name):
+                return handler(fs, args)
+        parser.print_help()
 
 if __name__ == "__main__":
     main()
@@ -6,7 +6,9 @@ import struct
 import time
 import argparse
 import os
+import queue
 import sys
+import threading
 from typing import Optional
 
 # --- Constants ---
@@ -22,6 +24,10 @@ BAUD_RATE = 115200
 # Set it long enough to allow the device to prepare the next file, but short enough to detect a total stall.
 READ_TIMEOUT_INTER_FILE = 5 # Seconds (timeout between files/parts)
 READ_TIMEOUT_DATA = 2      # Seconds (timeout during data stream of a single file)
+FILE_BUFFER_SIZE = 1 << 20 # Received data is staged in memory and written to disk in batches of this size
+RX_BUFFER_SIZE = 1 << 20   # Driver receive buffer to request (Windows only)
+SIZE_HEADER = struct.Struct('<I') # File size prefix, compiled once
+PIPELINE_BUFFERS = 4       # Staging buffers in flight between the serial reader and the disk writer
 # Note: pyserial doesn't have a separate 'inter_byte_timeout'. The 'timeout' parameter
 # behaves differently based on value:
 #   None: Block forever
@@ -70,41 +76,199 @@ def find_cdc_port(vid: int, pid: int, product_substring: Optional[str] = None) -
     print(f"-> Using CDC port: {matching_ports[0]}")
     return matching_ports[0]
 
+# --- Buffered Serial Reader ---
+class BufferedSerialReader:
+    """
+    Reads a serial port through an internal buffer. Each refill takes whatever
+    the port already has waiting (at least 1 byte, at most MAX_READ) instead of
+    issuing one read() per byte, and the buffer is then searched/sliced in memory.
+    """
+    MAX_READ = 65536
+
+    def __init__(self, ser: serial.Serial):
+        self.ser = ser
+        self._buf = bytearray()
+
+    def _fill(self) -> bool:
+        """Appends the next read to the buffer. Returns False on timeout."""
+        chunk = self.ser.read(min(max(1, self.ser.in_waiting), self.MAX_READ))
+        if not chunk:
+            return False
+        self._buf += chunk
+        return True
+
+    def read_until(self, terminator: bytes = b'\0') -> Optional[bytes]:
+        """Returns the bytes before `terminator` (consuming it), or None on timeout."""
+        start = 0
+        while True:
+            end = self._buf.find(terminator, start)
+            if end >= 0:
+                data = bytes(self._buf[:end])
+                del self._buf[:end + len(terminator)]
+                return data
+            # Only the new bytes need searching next time
+            start = max(0, len(self._buf) - len(terminator) + 1)
+            if not self._fill():
+                return None
+
+    def read_exact(self, size: int) -> bytes:
+        """Returns `size` bytes, or fewer if the port timed out first."""
+        while len(self._buf) < size:
+            if not self._fill():
+                break
+        data = bytes(self._buf[:size])
+        del self._buf[:size]
+        return data
+
+    def readinto(self, view: memoryview) -> int:
+        """Fills up to len(view) bytes (buffered data first). Returns the count, 0 on timeout."""
+        if not self._buf:
+            # Nothing buffered: let the port fill the caller's buffer directly
+            return self.ser.readinto(view)
+        n = min(len(self._buf), len(view))
+        view[:n] = self._buf[:n]
+        del self._buf[:n]
+        return n
+
+def tune_serial_port(ser: serial.Serial) -> None:
+    """Best-effort throughput settings; silently skipped where unsupported."""
+    # Linux: ask the tty layer not to batch small reads (ASYNC_LOW_LATENCY)
+    if hasattr(ser, 'set_low_latency_mode'):
+        try:
+            ser.set_low_latency_mode(True)
+        except (OSError, ValueError):
+            pass # Not supported by this driver
+    # Windows: a larger driver buffer so bursts aren't dropped between reads
+    if hasattr(ser, 'set_buffer_size'):
+        try:
+            ser.set_buffer_size(rx_size=RX_BUFFER_SIZE, tx_size=RX_BUFFER_SIZE)
+        except (OSError, ValueError, serial.SerialException):
+            pass
+
+def write_all(fd: int, data: memoryview) -> None:
+    """os.write() until all of `data` is written (a single call may write less)."""
+    while data:
+        data = data[os.write(fd, data):]
+
+class FileWriter:
+    """
+    Writes staged buffers of received data to disk. When pipelined, the writes
+    (and closing each file) happen on a background thread, so the next buffer
+    can be read from the port while earlier ones are still going to disk.
+    Buffers come from a fixed free list rather than being allocated per chunk.
+    """
+
+    def __init__(self, buffer_size: int, pipelined: bool = True):
+        self._free = queue.Queue()
+        for _ in range(PIPELINE_BUFFERS if pipelined else 1):
+            self._free.put(bytearray(buffer_size))
+        self._pending = queue.Queue()
+        self._error: Optional[Exception] = None
+        self._thread = None
+        if pipelined:
+            self._thread = threading.Thread(target=self._run, name="cdc-writer", daemon=True)
+            self._thread.start()
+
+    def take_buffer(self) -> bytearray:
+        """Returns a free staging buffer, waiting for the writer if all are in use."""
+        return self._free.get()
+
+    def write(self, fd: int, buf: bytearray, length: int) -> None:
+        """Writes buf[:length] to fd and hands buf back to the free list afterwards."""
+        self.check()
+        self._submit((fd, buf, length))
+
+    def close_file(self, fd: int) -> None:
+        """Closes fd once everything already queued for it has been written."""
+        self._submit((fd, None, 0))
+
+    def wait(self) -> None:
+        """Blocks until every queued write and close has completed."""
+        if self._thread is not None:
+            self._pending.join()
+
+    def check(self) -> None:
+        """Raises the first error hit by the background writer, if any."""
+        if self._error is not None:
+            raise self._error
+
+    def close(self) -> None:
+        """Stops the background writer after draining the queue."""
+        if self._thread is not None:
+            self._pending.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _submit(self, item) -> None:
+        if self._thread is None:
+            self._process(item) # Not pipelined: errors propagate to the caller directly
+        else:
+            self._pending.put(item)
+
+    def _process(self, item) -> None:
+        fd, buf, length = item
+        if buf is None:
+            os.close(fd)
+            return
+        try:
+            write_all(fd, memoryview(buf)[:length])
+        finally:
+            self._free.put(buf)
+
+    def _run(self) -> None:
+        while True:
+            item = self._pending.get()
+            try:
+                if item is None:
+                    return
+                self._process(item)
+            except Exception as e:
+                # Any failure is kept for check(); the loop goes on draining so that
+                # the reader never blocks on a full queue or an empty free list
+                if self._error is None:
+                    self._error = e
+            finally:
+                self._pending.task_done()
+
 # --- Receive Logic ---
-def receive_files_via_cdc(port: str, output_dir: str):
-    """Receives files (filename, size, data) over CDC and saves them."""
+def receive_files_via_cdc(port: str, output_dir: str, pipelined: bool = True):
+    """
+    Receives files (filename, size, data) over CDC and saves them.
+    With pipelined=False, disk writes happen inline on the reading thread (for debugging).
+    """
     print(f"\n--- Starting CDC Receiver on {port} ---")
     print(f"Saving files to: {output_dir}")
     os.makedirs(output_dir, exist_ok=True)
 
     files_received_count = 0
     total_bytes_received = 0
+    writer = FileWriter(FILE_BUFFER_SIZE, pipelined)
 
     try:
         # Use a longer timeout initially when waiting for the first filename
         with serial.Serial(port, BAUD_RATE, timeout=READ_TIMEOUT_INTER_FILE) as ser:
             print(f"Serial port {port} opened. Waiting for first filename...")
+            tune_serial_port(ser)
+            reader = BufferedSerialReader(ser)
+            # The port reads into a staging buffer in place; each full buffer is
+            # handed to the writer and replaced from its free list, keeping peak memory bounded
+            data_buf = writer.take_buffer()
+            data_view = memoryview(data_buf)
 
             while True:
                 # 1. Receive Filename (null-terminated)
-                filename_bytes = bytearray()
-                while True:
-                    # Read one byte at a time to detect null terminator
-                    byte = ser.read(1)
-                    if not byte:
-                        # Timeout occurred waiting for filename byte
-                        print("\nTimeout waiting for filename byte. Assuming transfer complete or stalled.")
-                        # If we haven't received any files yet, it's likely an error.
-                        if files_received_count == 0:
-                             print("ERROR: No files received before timeout.")
-                             raise TimeoutError("Timeout waiting for the first filename.")
-                        else:
-                             # If we received files, timeout might mean completion.
-                             print("Treating timeout as end-of-transfer signal.")
-                             break # Exit filename loop, will lead to outer loop break
-                    if byte == b'\0':
-                        break # End of filename
-                    filename_bytes.extend(byte)
+                filename_bytes = reader.read_until(b'\0')
+                if filename_bytes is None:
+                    # Timeout occurred waiting for filename byte
+                    print("\nTimeout waiting for filename byte. Assuming transfer complete or stalled.")
+                    # If we haven't received any files yet, it's likely an error.
+                    if files_received_count == 0:
+                         print("ERROR: No files received before timeout.")
+                         raise TimeoutError("Timeout waiting for the first filename.")
+                    else:
+                         # If we received files, timeout might mean completion.
+                         print("Treating timeout as end-of-transfer signal.")
+                         filename_bytes = b'' # Leads to outer loop break
 
                 if not filename_bytes:
                     # Received null byte immediately - this is our termination signal
@@ -116,14 +280,14 @@ def receive_files_via_cdc(port: str, output_dir: str):
 
                 # 2. Receive Size (4 bytes, Little Endian)
                 ser.timeout = READ_TIMEOUT_INTER_FILE # Use inter-file timeout for reading size
-                size_bytes = ser.read(4)
+                size_bytes = reader.read_exact(4)
                 if len(size_bytes) < 4:
                     print(f"\nERROR: Timeout or short read receiving size for '{filename}'. Expected 4 bytes, got {len(size_bytes)}.")
                     # Decide how to handle: Abort? Skip file?
                     print("Aborting transfer.")
                     break # Exit the main loop
 
-                expected_size = struct.unpack('<I', size_bytes)[0]
+                expected_size, = SIZE_HEADER.unpack(size_bytes)
                 print(f"Expecting Size: {expected_size} bytes")
 
                 # 3. Receive Data
@@ -131,19 +295,36 @@ def receive_files_via_cdc(port: str, output_dir: str):
                 received_bytes = 0
                 ser.timeout = READ_TIMEOUT_DATA # Switch to data timeout for content
                 try:
-                    with open(output_path, 'wb') as f:
+                    # Raw fd: data_buf already batches the writes, so a Python file
+                    # object would only add another copy (O_BINARY for Windows)
+                    fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+                    try:
+                        # Reserve the full size up front rather than growing the file per write
+                        os.ftruncate(fd, expected_size)
+                        if hasattr(os, 'posix_fadvise'): # Not available on Windows
+                            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
                         start_time = time.time()
+                        filled = 0
                         while received_bytes < expected_size:
-                            # Read in chunks for efficiency
-                            bytes_to_read = min(4096, expected_size - received_bytes)
-                            chunk = ser.read(bytes_to_read)
-                            if not chunk:
+                            # Ask for the rest of the file (or of the staging buffer) in one call:
+                            # pyserial keeps reading until it has it all or the timeout expires,
+                            # so a file that fits the buffer is normally a single read. The timeout
+                            # bounds each call, not the file, so a partial read just loops again;
+                            # only a call that returns nothing means the stream stalled.
+                            bytes_to_read = min(expected_size - received_bytes, len(data_buf) - filled)
+                            n = reader.readinto(data_view[filled:filled + bytes_to_read])
+                            if not n:
                                 # Timeout occurred during data transfer
                                 print(f"\nERROR: Timeout receiving data for '{filename}' at {received_bytes}/{expected_size} bytes.")
                                 raise TimeoutError(f"Timeout receiving data for {filename}")
 
-                            f.write(chunk)
-                            received_bytes += len(chunk)
+                            filled += n
+                            received_bytes += n
+                            if filled == len(data_buf) or received_bytes == expected_size:
+                                writer.write(fd, data_buf, filled)
+                                data_buf = writer.take_buffer()
+                                data_view = memoryview(data_buf)
+                                filled = 0
 
                             # Optional: Progress within a large file
                             # print(f"... {received_bytes}/{expected_size} bytes", end='\r')
@@ -154,9 +335,12 @@ def receive_files_via_cdc(port: str, output_dir: str):
                         print(f"-> Saved '{output_path}' ({received_bytes} bytes) in {duration:.2f}s [{rate:.1f} KB/s]")
                         files_received_count += 1
                         total_bytes_received += received_bytes
+                    finally:
+                        writer.close_file(fd)
 
                 except TimeoutError:
                     # Clean up potentially incomplete file?
+                    writer.wait() # Its fd must be closed before removal on Windows
                     print(f"Attempting to remove incomplete file: {output_path}")
                     try:
                         os.remove(output_path)
@@ -170,6 +354,10 @@ def receive_files_via_cdc(port: str, output_dir: str):
                     # Reset timeout for next filename/termination signal
                      ser.timeout = READ_TIMEOUT_INTER_FILE
 
+            # Everything reported as saved must actually have reached the files
+            writer.wait()
+            writer.check()
+
     except serial.SerialException as e:
         print(f"\nERROR: Serial communication error on port {port}: {e}")
         print("       Check device connection, ensure it's not in use elsewhere (QMK Toolbox, screen).")
@@ -177,11 +365,16 @@ def receive_files_via_cdc(port: str, output_dir: str):
     except TimeoutError as e:
         print(f"\nERROR: Timeout occurred: {e}")
         return False # Indicate failure
+    except OSError as e:
+        print(f"\nERROR: Could not write received data: {e}")
+        return False # Indicate failure
     except Exception as e:
         print(f"\nERROR: An unexpected error occurred: {e}")
         import traceback
         traceback.print_exc()
         return False # Indicate failure
+    finally:
+        writer.close()
 
     print(f"\n--- CDC Receiver Finished ---")
     print(f"Total files received: {files_received_count}")
@@ -195,6 +388,7 @@ if __name__ == "__main__":
     parser.add_argument("--port", help="Specify the serial port manually (e.g., /dev/ttyACM0 or COM3).")
     parser.add_argument("--vid", type=lambda x: int(x, 0), default=EXPECTED_VID, help="Device Vendor ID (hex or dec).")
     parser.add_argument("--pid", type=lambda x: int(x, 0), default=EXPECTED_PID, help="Device Product ID (hex or dec).")
+    parser.add_argument("--no-pipeline", action="store_true", help="Write to disk on the reading thread instead of a background writer (for debugging).")
 
     args = parser.parse_args()
 
@@ -215,6 +409,6 @@ if __name__ == "__main__":
              print(f"Error: Could not create output directory '{args.output_dir}': {e}")
              sys.exit(1)
 
-    success = receive_files_via_cdc(cdc_port, args.output_dir)
+    success = receive_files_via_cdc(cdc_port, args.output_dir, pipelined=not args.no_pipeline)
 
     sys.exit(0 if success else 1)
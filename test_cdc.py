@@ -3,10 +3,14 @@
 import serial
 import serial.tools.list_ports
 import struct
+import array
+import functools
 import time
 import argparse
 import os
 import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Tuple, Optional
 
 # --- Dependency Check ---
@@ -17,10 +21,17 @@ except ImportError:
     print("Please install it: pip install Pillow")
     sys.exit(1)
 
+try:
+    import numpy as np
+except ImportError:
+    # Optional: without NumPy pixels are converted one at a time below
+    np = None
+
 # --- Constants ---
 # Device Identification
 EXPECTED_VID = 0x1067
 EXPECTED_PID = 0x626D
+CDC_PRODUCT_NAME = "Module CDC Interface" # Fallback match on the USB product string
 
 # Serial Communication Parameters
 BAUD_RATE = 115200         # Often ignored for USB CDC, but set anyway
@@ -29,32 +40,56 @@ READ_TIMEOUT = 1           # Seconds for reading confirmations (optional)
 PRE_SEND_DELAY = 0.2       # Seconds to wait after opening port before sending anything
 POST_HEADER_DELAY = 0.1    # Seconds to wait after sending size header, before sending data
 POST_FILENAME_DELAY = 0.1  # Seconds to wait after sending filename
-SEND_CHUNK_SIZE = 4096     # Bytes to send per write call for progress reporting
+SIZE_HEADER = struct.Struct('<I') # File size prefix, compiled once
+SEND_CHUNK_SIZE = 65536    # Bytes per write call; only sets how often progress is reported
+ENCODE_AHEAD_FRAMES = 4    # Frames encoded ahead of the one being sent
 
 # Image Processing Defaults
 DEFAULT_RESIZE_W = 128
 DEFAULT_RESIZE_H = 128
 DEFAULT_BG_COLOR = (0, 0, 0) # Black
+RESIZE_REDUCING_GAP = 3.0 # Downscales box-reduce (or DCT-scale, for JPEG) to within this factor before resampling
+
+# Per-channel RGB565 contributions for the non-NumPy path (lookups beat shifts in CPython)
+R_LUT = tuple((v >> 3) << 11 for v in range(256))
+G_LUT = tuple((v >> 2) << 5 for v in range(256))
+B_LUT = tuple(v >> 3 for v in range(256))
+
+class _SanitizeTable(dict):
+    """str.translate table mapping each non-alphanumeric character to '_', filled in as characters are seen."""
+    def __missing__(self, code: int) -> str:
+        char = chr(code)
+        self[code] = replacement = char if char.isalnum() else '_'
+        return replacement
+
+FILENAME_SANITIZE_TABLE = _SanitizeTable()
 
 # --- Image Processing Functions ---
-def process_image_frame(frame: Image.Image, target_size: tuple[int, int], background_color: tuple[int, int, int]) -> bytes:
+@functools.lru_cache(maxsize=8)
+def solid_background(size: Tuple[int, int], color: Tuple[int, int, int]) -> Image.Image:
+    """Opaque RGBA background for compositing; alpha_composite doesn't modify it, so every frame shares one."""
+    return Image.new("RGBA", size, color + (255,))
+
+def process_image_frame(frame: Image.Image, target_size: tuple[int, int], background_color: tuple[int, int, int],
+                        resample: int = Image.Resampling.LANCZOS) -> bytes:
     """
     Converts a single PIL Image frame to raw RGB565 bytes (big-endian).
     Handles resizing and transparency.
     """
     try:
-        # Resize first
-        frame_resized = frame.resize(target_size, Image.Resampling.LANCZOS)
+        # Resize first. reducing_gap lets large downscales box-reduce by an integer
+        # factor before the resample filter (ignored by Pillow for frames with transparency).
+        frame_resized = frame.resize(target_size, resample, reducing_gap=RESIZE_REDUCING_GAP)
 
         # Handle transparency by compositing onto the specified background color
         if frame_resized.mode in ('RGBA', 'LA') or (frame_resized.mode == 'P' and 'transparency' in frame_resized.info):
             # print(f"  Handling transparency for frame...") # Verbose
             try:
-                alpha = frame_resized.convert('RGBA').split()[-1]
-                bg = Image.new("RGB", frame_resized.size, background_color)
-                img_rgb = frame_resized.convert("RGB") # Convert potential P mode after handling transparency logic
-                bg.paste(img_rgb, mask=alpha)
-                image_to_convert = bg
+                # One C-level composite onto an opaque background, no alpha split/paste.
+                # convert() to the same mode still copies, so RGBA frames are used as-is.
+                rgba = frame_resized if frame_resized.mode == 'RGBA' else frame_resized.convert('RGBA')
+                bg = solid_background(frame_resized.size, tuple(background_color))
+                image_to_convert = Image.alpha_composite(bg, rgba).convert('RGB')
             except Exception as e:
                 print(f"  Warning: Error handling transparency: {e}. Trying simple convert.")
                 image_to_convert = frame_resized.convert('RGB')
@@ -68,23 +103,41 @@ def process_image_frame(frame: Image.Image, target_size: tuple[int, int], backgr
             image_to_convert = frame_resized # Already RGB
 
         # print("  Converting pixels to RGB565 (Big Endian)...") # Verbose
-        frame_data = bytearray()
-        pixels = list(image_to_convert.getdata())
-        for r, g, b in pixels:
-            r5 = r >> 3
-            g6 = g >> 2
-            b5 = b >> 3
-            rgb565 = (r5 << 11) | (g6 << 5) | b5
+        if np is not None:
+            # Pack the whole frame at once instead of per pixel
+            arr = np.asarray(image_to_convert)
+            rgb565 = (((arr[..., 0].astype(np.uint16) >> 3) << 11)
+                      | ((arr[..., 1].astype(np.uint16) >> 2) << 5)
+                      | (arr[..., 2] >> 3))
             # Outputting Big Endian (>H) for pixel data
-            frame_data.extend(struct.pack('>H', rgb565))
-        return bytes(frame_data)
+            return rgb565.astype('>u2').tobytes()
+
+        pixels = image_to_convert.tobytes()
+        # Collect native uint16s and fix the byte order once, instead of a struct.pack per pixel
+        r_lut, g_lut, b_lut = R_LUT, G_LUT, B_LUT # Locals: faster lookups in the loop
+        frame_data = array.array('H', [r_lut[r] | g_lut[g] | b_lut[b]
+                                       for r, g, b in zip(pixels[0::3], pixels[1::3], pixels[2::3])])
+        if sys.byteorder == 'little':
+            frame_data.byteswap() # Outputting Big Endian (>H) for pixel data
+        return frame_data.tobytes()
 
     except Exception as e:
         print(f"Error processing frame: {e}")
         return b''
 
 # --- Serial Port Function ---
-def find_port(vid: int, pid: int) -> Optional[str]:
+def _port_matches(p, vid: int, pid: int) -> bool:
+    """True if a comports() entry is the module, by VID/PID or, failing that, HWID/product string."""
+    # Check explicit VID/PID first
+    if p.vid == vid and p.pid == pid:
+        return True
+    # Fallback check in HWID string (more robust)
+    hwid = p.hwid or ""
+    if f"VID:PID={vid:04X}:{pid:04X}" in hwid or f"VID_{vid:04X}&PID_{pid:04X}" in hwid:
+        return True
+    return bool(p.product and CDC_PRODUCT_NAME in p.product)
+
+def find_port(vid: int, pid: int, verbose: bool = False) -> Optional[str]:
     """Return the device name for the first port matching VID/PID."""
     print(f"Searching for CDC serial port with VID={vid:#06x}, PID={pid:#06x}...")
     ports = serial.tools.list_ports.comports()
@@ -92,24 +145,12 @@ def find_port(vid: int, pid: int) -> Optional[str]:
         print("No serial ports found.")
         return None
 
-    matching_ports = []
-    print("Available Serial Ports:")
-    for p in ports:
-        print(f"  {p.device}: VID={p.vid} PID={p.pid} (Desc: {p.description}, HWID: {p.hwid})")
-        # Check explicit VID/PID first
-        if p.vid == vid and p.pid == pid:
-            print(f"    -> Matched VID/PID directly.")
-            matching_ports.append(p.device)
-            continue # Prioritize direct match
-        # Fallback check in HWID string (more robust)
-        vid_pid_str1 = f"VID:PID={vid:04X}:{pid:04X}"
-        vid_pid_str2 = f"VID_{vid:04X}&PID_{pid:04X}"
-        product_name = "Module CDC Interface" # Added check for product name
-        if (p.hwid and (vid_pid_str1 in p.hwid or vid_pid_str2 in p.hwid)) or \
-           (p.product and product_name in p.product):
-            print(f"    -> Matched VID/PID/Product in HWID/Desc string.")
-            if p.device not in matching_ports: # Avoid duplicates
-                 matching_ports.append(p.device)
+    if verbose:
+        print("Available Serial Ports:")
+        for p in ports:
+            print(f"  {p.device}: VID={p.vid} PID={p.pid} (Desc: {p.description}, HWID: {p.hwid})")
+    # One pass over the single scan, keeping port order and dropping duplicates
+    matching_ports = list(dict.fromkeys(p.device for p in ports if _port_matches(p, vid, pid)))
 
     if not matching_ports:
         print("-> No matching CDC port found.")
@@ -121,32 +162,59 @@ def find_port(vid: int, pid: int) -> Optional[str]:
     return matching_ports[0]
 
 # --- Send Data Function (with chunking and progress) ---
-def send_file_over_cdc(serial_port: serial.Serial, filename_on_device: str, data: bytes):
-    """Sends filename, size, and data over the serial port with progress."""
+def send_file_over_cdc(serial_port: serial.Serial, filename_on_device: str, data, header_delay: bool = False,
+                       data_size: Optional[int] = None, progress: bool = True):
+    """
+    Sends filename, size, and data over the serial port with progress.
+    `data` is bytes-like, or (with `data_size` given) an iterable of bytes-like
+    chunks totalling `data_size` bytes, each sent as soon as it is produced.
+    With header_delay, the filename and size are written and flushed separately,
+    each followed by a pause, for firmware that needs time to parse them.
+    With progress=False no percentages are printed, and bytes-like data is not
+    split into SEND_CHUNK_SIZE writes (streamed chunks are still sent as they come).
+    """
     print(f"\n--- Sending to Device ({serial_port.port}) ---")
     print(f"Target Filename: {filename_on_device}")
-    total_data_size = len(data)
+    if data_size is None:
+        data_view = memoryview(data) # Slices without copying
+        total_data_size = len(data_view)
+        # Chunks only exist to report progress; without it, hand the driver everything at once
+        chunk_size = SEND_CHUNK_SIZE if progress else max(total_data_size, 1)
+        chunks = (data_view[i:i + chunk_size] for i in range(0, total_data_size, chunk_size))
+    else:
+        total_data_size = data_size
+        chunks = data
     print(f"Data Size: {total_data_size} bytes")
 
-    # 1. Send Filename (UTF-8 encoded, null-terminated)
+    # 1. Filename (UTF-8 encoded, null-terminated)
     filename_bytes = filename_on_device.encode('utf-8') + b'\0'
-    print(f"Sending filename ({len(filename_bytes)} bytes): {filename_bytes.hex()}...")
-    bytes_written_fn = serial_port.write(filename_bytes)
-    serial_port.flush()
-    if bytes_written_fn != len(filename_bytes):
-        raise IOError(f"Failed to write full filename (wrote {bytes_written_fn}/{len(filename_bytes)})")
-    print("-> Filename sent.")
-    time.sleep(POST_FILENAME_DELAY)
-
-    # 2. Send Size Header (4 bytes, Little Endian)
-    size_header = struct.pack('<I', total_data_size) # Little Endian for size
-    print(f"Sending size header ({len(size_header)} bytes): {size_header.hex()}...")
-    bytes_written_h = serial_port.write(size_header)
-    serial_port.flush()
-    if bytes_written_h != 4:
-         raise IOError(f"Failed to write full size header (wrote {bytes_written_h})")
-    print("-> Size header sent.")
-    time.sleep(POST_HEADER_DELAY)
+    # 2. Size Header (4 bytes, Little Endian)
+    size_header = SIZE_HEADER.pack(total_data_size) # Little Endian for size
+
+    if header_delay:
+        print(f"Sending filename ({len(filename_bytes)} bytes): {filename_bytes.hex()}...")
+        bytes_written_fn = serial_port.write(filename_bytes)
+        serial_port.flush()
+        if bytes_written_fn != len(filename_bytes):
+            raise IOError(f"Failed to write full filename (wrote {bytes_written_fn}/{len(filename_bytes)})")
+        print("-> Filename sent.")
+        time.sleep(POST_FILENAME_DELAY)
+
+        print(f"Sending size header ({len(size_header)} bytes): {size_header.hex()}...")
+        bytes_written_h = serial_port.write(size_header)
+        serial_port.flush()
+        if bytes_written_h != 4:
+             raise IOError(f"Failed to write full size header (wrote {bytes_written_h})")
+        print("-> Size header sent.")
+        time.sleep(POST_HEADER_DELAY)
+    else:
+        # One write for both headers, straight into the data without pausing
+        header = filename_bytes + size_header
+        print(f"Sending filename and size header ({len(header)} bytes): {header.hex()}...")
+        bytes_written_h = serial_port.write(header)
+        if bytes_written_h != len(header):
+            raise IOError(f"Failed to write full header (wrote {bytes_written_h}/{len(header)})")
+        print("-> Filename and size header sent.")
 
     # 3. Send Actual Data in Chunks with Progress Reporting
     print(f"Sending data block ({total_data_size} bytes)...")
@@ -154,25 +222,22 @@ def send_file_over_cdc(serial_port: serial.Serial, filename_on_device: str, data
     bytes_sent = 0
     last_reported_progress = -1 # Initialize to ensure 0% or first report gets printed
 
-    while bytes_sent < total_data_size:
-        chunk = data[bytes_sent : bytes_sent + SEND_CHUNK_SIZE]
+    for chunk in chunks:
         bytes_to_send = len(chunk)
+        # No flush per chunk: pyserial's write() already blocks until the OS has
+        # taken the data, and draining the TX queue each time stalls the pipeline
         bytes_written_chunk = serial_port.write(chunk)
-        # It's often better to flush *after* writing, but experiment if issues arise
-        serial_port.flush()
-
-        # Check write result (optional, timeout is main check)
         if bytes_written_chunk != bytes_to_send:
-            print(f"\nWarning: Chunk write mismatch! Target {bytes_to_send}, write() returned {bytes_written_chunk}.")
-            # Decide how to handle: maybe retry, maybe just continue and rely on timeout
+            # write() raises SerialTimeoutException on timeout, so this means a driver fault
+            raise IOError(f"Chunk write mismatch at {bytes_sent}: wrote {bytes_written_chunk}/{bytes_to_send}")
 
-        bytes_sent += bytes_to_send # Update progress based on intended send size for the chunk
+        bytes_sent += bytes_to_send
 
         # Calculate and report progress
         progress_percent = int((bytes_sent / total_data_size) * 100) if total_data_size > 0 else 100
 
         # Report every 10% milestone
-        if progress_percent >= last_reported_progress + 10:
+        if progress and progress_percent >= last_reported_progress + 10:
             # Avoid printing 100% here, print completion message later
             if progress_percent < 100:
                 print(f"... {progress_percent}% sent ({bytes_sent}/{total_data_size} bytes)")
@@ -181,8 +246,13 @@ def send_file_over_cdc(serial_port: serial.Serial, filename_on_device: str, data
         # Add a tiny sleep if needed to allow device processing, but usually not necessary
         # time.sleep(0.001)
 
+    if bytes_sent != total_data_size:
+        # The device would wait for the rest (or read past the end) of what the header announced
+        raise IOError(f"Data ended at {bytes_sent} of the {total_data_size} bytes announced")
+    serial_port.flush() # Once, so the timing below covers the data actually leaving
     end_time = time.time()
-    print(f"... 100% sent ({bytes_sent}/{total_data_size} bytes)") # Final progress
+    if progress:
+        print(f"... 100% sent ({bytes_sent}/{total_data_size} bytes)") # Final progress
     print("-> Data sending complete.")
 
     duration = end_time - start_time
@@ -192,6 +262,46 @@ def send_file_over_cdc(serial_port: serial.Serial, filename_on_device: str, data
     # Consider adding a small delay or waiting for an ACK from the device if implemented
 
 
+def stream_processed_frames(frames, encode, frame_size, failed_frames):
+    """
+    Yields each encoded frame in order, keeping at most ENCODE_AHEAD_FRAMES encoding
+    on a thread pool. `frames` may be a generator, so only those frames are held
+    in memory. The size header is already sent by then, so a frame that fails to
+    encode is sent as black to keep the byte count in step with it, and its
+    number is appended to failed_frames.
+    """
+    with ThreadPoolExecutor(max_workers=ENCODE_AHEAD_FRAMES) as executor:
+        pending = deque()
+        try:
+            for i, frame in enumerate(frames):
+                pending.append((i, frame, executor.submit(encode, frame)))
+                if len(pending) >= ENCODE_AHEAD_FRAMES:
+                    yield report_processed_frame(*pending.popleft(), frame_size, failed_frames)
+            while pending:
+                yield report_processed_frame(*pending.popleft(), frame_size, failed_frames)
+        finally:
+            for _, _, future in pending: # Drop frames left unencoded after a failed send
+                future.cancel()
+
+
+def report_processed_frame(i, frame, future, frame_size, failed_frames):
+    """Waits for one frame's data and reports it as before, zero-filling a failed frame."""
+    print(f"--- Python Frame {i} ---")
+    print(f"  - Info: {frame.info}")
+
+    try:
+        processed_frame_data = future.result()
+    except Exception as e:
+        print(f"  - Error encoding frame: {e}")
+        processed_frame_data = b''
+    if len(processed_frame_data) != frame_size:
+        print(f"  - Warning: Failed to process frame {i + 1}; sending it as black.")
+        failed_frames.append(i + 1)
+        return bytes(frame_size)
+
+    print(f"  - RGB565 Sample (first 32 bytes): {processed_frame_data[:32].hex()}")
+    return processed_frame_data
+
 # --- Main Execution Logic ---
 def main():
     parser = argparse.ArgumentParser(description="Process an image/GIF and send its raw RGB565 data over CDC serial.")
@@ -201,6 +311,13 @@ def main():
     parser.add_argument("--height", type=int, default=DEFAULT_RESIZE_H, help=f"Target height (default: {DEFAULT_RESIZE_H}).")
     parser.add_argument("--bg", type=str, default=",".join(map(str, DEFAULT_BG_COLOR)),
                         help=f"Background color R,G,B for transparency (default: {DEFAULT_BG_COLOR}).")
+    parser.add_argument("--legacy-header-delay", action="store_true",
+                        help=f"Send filename and size separately, pausing {POST_FILENAME_DELAY}s/{POST_HEADER_DELAY}s after each (for older firmware).")
+    parser.add_argument("--verbose", action="store_true", help="List every serial port found while locating the device.")
+    parser.add_argument("--no-progress", action="store_true",
+                        help="Don't print progress percentages while sending (for scripted use).")
+    parser.add_argument("--fast-resize", action="store_true",
+                        help="Resize with a bicubic filter instead of Lanczos (faster, slightly softer).")
 
     args = parser.parse_args()
 
@@ -211,6 +328,9 @@ def main():
 
     print(f"\n--- Processing File: {args.image_path} ---")
     target_size = (args.width, args.height)
+    # BICUBIC is a polynomial kernel (no sin() per tap like LANCZOS); noticeably
+    # cheaper per frame for long GIFs, with little visible difference at this size
+    resample = Image.Resampling.BICUBIC if args.fast_resize else Image.Resampling.LANCZOS
     try:
         bg_color = tuple(map(int, args.bg.split(',')))
         if len(bg_color) != 3: raise ValueError("Background color needs 3 values (R,G,B)")
@@ -219,7 +339,9 @@ def main():
         sys.exit(1)
 
     output_data = bytearray()
+    output_size = 0
     is_animated = False
+    failed_frames = [] # Frame numbers sent as black because they failed to encode
     target_filename_on_device = ""
 
     try:
@@ -230,48 +352,53 @@ def main():
         if getattr(img, "is_animated", False) or img.format == "GIF":
             is_animated = True
             print("Detected animated format (GIF). Processing frames...")
-            frame_count = 0
-            # Attempt to get total frames if possible (for better progress estimate during processing)
-            total_frames = getattr(img, "n_frames", 0)
-            if total_frames > 0:
-                print(f"Found {total_frames} frames.")
-
-            for i, frame in enumerate(ImageSequence.Iterator(img)):
-                frame_count += 1
-                print(f"--- Python Frame {i} ---")
-                print(f"  - Info: {frame.info}")
-                
-                processed_frame_data = process_image_frame(frame, target_size, bg_color)
-                if not processed_frame_data:
-                    raise ValueError(f"Failed to process frame {frame_count}")
-
-                print(f"  - RGB565 Sample (first 32 bytes): {processed_frame_data[:32].hex()}")
-                output_data.extend(processed_frame_data)
+            frame_count = getattr(img, "n_frames", 1)
+            print(f"Found {frame_count} frames.")
+            # Frames are decoded as the send pulls them, so only the few being encoded
+            # are held at once. They are copies because the iterator reuses one Image object.
+            frames = (frame.copy() for frame in ImageSequence.Iterator(img))
+            # Every frame encodes to the same size, so the size header is known before
+            # any frame is processed and frames can be streamed to the device
+            frame_size = target_size[0] * target_size[1] * 2
+            output_size = frame_size * frame_count
+
+            # Frames are independent, and Pillow/NumPy release the GIL while resizing,
+            # compositing and packing, so a thread pool spreads them across cores
+            # without pickling them to worker processes. Encoding starts as the
+            # send pulls frames, stays a few frames ahead of it, and yields the
+            # results in frame order.
+            output_data = stream_processed_frames(
+                frames, lambda fr: process_image_frame(fr, target_size, bg_color, resample), frame_size,
+                failed_frames)
 
             if frame_count == 0:
                  print("Warning: Animated file reported, but no frames found/processed.")
-            print(f"Processed {frame_count} frames.")
+            print(f"Decoding and encoding {frame_count} frames while sending.")
         else:
             print("Detected static image format. Processing single frame...")
-            processed_frame_data = process_image_frame(img, target_size, bg_color)
+            # Let the JPEG decoder scale down by a power of two while decoding, keeping
+            # at least RESIZE_REDUCING_GAP times the target size (no-op for other formats)
+            img.draft(None, (int(target_size[0] * RESIZE_REDUCING_GAP), int(target_size[1] * RESIZE_REDUCING_GAP)))
+            processed_frame_data = process_image_frame(img, target_size, bg_color, resample)
             if not processed_frame_data:
                  raise ValueError("Failed to process static image")
             output_data = processed_frame_data
+            output_size = len(output_data)
             print("Processed 1 frame.")
 
         # Determine filename extension
         base_name = os.path.splitext(os.path.basename(args.image_path))[0]
         # Sanitize basename: replace non-alphanumeric with underscore, limit length
-        sanitized_base_name = "".join(c if c.isalnum() else '_' for c in base_name)
+        sanitized_base_name = base_name.translate(FILENAME_SANITIZE_TABLE)
         sanitized_base_name = sanitized_base_name[:50] # Limit length
 
-        output_ext = ".araw" if is_animated and len(output_data) > 0 else ".raw"
+        output_ext = ".araw" if is_animated and output_size > 0 else ".raw"
         target_filename_on_device = sanitized_base_name + output_ext
 
-        if not output_data:
+        if not output_size:
             print("Error: No data generated after processing.")
             sys.exit(1)
-        print(f"-> Final processed data size: {len(output_data)} bytes.")
+        print(f"-> Final processed data size: {output_size} bytes.")
         print(f"-> Target filename on device: {target_filename_on_device}")
 
 
@@ -288,7 +415,7 @@ def main():
         print(f"Port: {port}")
     else:
         print(f"\n--- Locating Device ---")
-        port = find_port(EXPECTED_VID, EXPECTED_PID)
+        port = find_port(EXPECTED_VID, EXPECTED_PID, verbose=args.verbose)
         if not port:
             print("Failed to find device port automatically. Try specifying with --port.")
             print("Ensure the QMK firmware with CDC enabled is flashed and the device is connected.")
@@ -306,7 +433,9 @@ def main():
             time.sleep(PRE_SEND_DELAY)
 
             # --- Send file using the new protocol ---
-            send_file_over_cdc(ser, target_filename_on_device, bytes(output_data))
+            # Animations are a stream of frames still being encoded; a still image is one buffer
+            send_file_over_cdc(ser, target_filename_on_device, output_data, header_delay=args.legacy_header_delay,
+                               data_size=output_size if is_animated else None, progress=not args.no_progress)
 
             # --- Optional: Wait for potential confirmation/response ---
             # print("Waiting briefly for any response from device (optional)...")
@@ -319,8 +448,13 @@ def main():
             # else:
             #     print("No immediate response received.")
 
-            print("\nSUCCESS: Data sending process completed.")
-            success = True
+            if failed_frames:
+                # The byte count still matched, but the animation on the device is corrupt
+                print(f"\nERROR: {len(failed_frames)} of {frame_count} frames failed to encode and were sent as black: "
+                      f"{', '.join(map(str, failed_frames))}")
+            else:
+                print("\nSUCCESS: Data sending process completed.")
+                success = True
 
     except serial.SerialTimeoutException:
         print(f"\nERROR: Serial write timeout after {WRITE_TIMEOUT}s on port {port}.")
@@ -337,6 +471,8 @@ def main():
         import traceback
         traceback.print_exc()
 
+    if is_animated:
+        output_data.close() # Shuts the encoding pool down if the send stopped early
     print(f"\n--- Operation {'Completed Successfully' if success else 'Failed'} ---")
     sys.exit(0 if success else 1)
 